@@ -28,10 +28,32 @@ class Agent():
     def __init__(self, position):
         self.position = position.copy()
         self.possible_moves = MOVES
+        self.maze = None # Maze.MazeIndex of the game, set by the game when available
+        self.game = None # game this agent moves in, set by the game when available (see self.lattice_index)
 
     def valid_moves(self, pos, valid):
         "Return the move vectors which are valid in the tiles at @pos."
+        "If this agent moves one tile at a time and @pos is on a tile, look them up in self.maze instead."
+        "If it moves 5 px at a time and @pos is on the 5-px lattice, look them up in self.game.lattice instead."
+        idx = self.tile(pos)
+        if idx is not None:
+            return list(self.maze.moves[idx])
+        k = self.lattice_index(pos)
+        if k is not None:
+            return [n for n, _ in self.game.lattice[k]]
         return [n for n, m in self.possible_moves.items() if valid(pos + m) and n != "stop"]
+
+    def lattice_index(self, pos):
+        "Return the index of @pos in the 5-px lattice of self.game, None if this agent doesn't move 5 px at a time or @pos is off the lattice."
+        if self.game is None or abs(self.possible_moves['up']) != 5:
+            return None
+        return self.game.lattice_index(pos)
+
+    def tile(self, pos):
+        "Return the tile index of @pos in self.maze, None if this agent doesn't move one tile at a time or @pos is not on a tile."
+        if self.maze is None or abs(self.possible_moves['up']) != 20:
+            return None
+        return self.maze.index(pos)
     
     def change_speed(self, ratio):
         "Change the move vectors by the given @ratio."
@@ -39,6 +61,12 @@ class Agent():
 
     def best_chase(self, chaser_pos, chasee_pos, valid):
         "Calculate the best action to take when chasing from @chaser_pos to @chasee_pos with A* search algorithm."
+        "If this agent moves one tile at a time and both positions are on tiles, look its action up in self.maze instead."
+        src = self.tile(chaser_pos)
+        if src is not None:
+            dst = self.maze.index(chasee_pos)
+            if dst is not None:
+                return self.maze.first_move(src, dst)
         pq = PriorityQueue()
         chaser_pos = chaser_pos.copy()
         fringe = set()
@@ -51,9 +79,9 @@ class Agent():
                 if distance(cnt_pos, chasee_pos) < 20:
                     return moves[0]
                 for n in self.valid_moves(cnt_pos, valid):
-                    if (cnt_pos + self.possible_moves[n]) in fringe:
-                        continue
                     nxt_pos = cnt_pos + self.possible_moves[n]
+                    if nxt_pos in fringe:
+                        continue
                     fringe.add(nxt_pos)
                     nmoves = moves.copy()
                     nmoves.append(n)
@@ -113,6 +141,10 @@ class GhostAgent(Agent):
         super().__init__(*args)
         self.i = i
 
+    def tile_action(self, state):
+        "Return the action (name) this agent will take in @state, whose positions are tile indices of self.maze. (see Engine.tile_positions)"
+        raise NotImplementedError("%s doesn't move one tile at a time" % type(self).__name__)
+
     def will_move(self, valid, state):
         "Return the action (move vector) this agent will take in the given state."
         "Minimize euclidean distance."
@@ -135,6 +167,10 @@ class AstarGhostAgent(GhostAgent):
         "A* search."
         return self.possible_moves[self.best_chase(self.position, state['pacman_pos'], valid)]
 
+    def tile_action(self, state):
+        "Return the action (name) this agent will take in @state, whose positions are tile indices of self.maze."
+        return self.maze.first_move(state['ghost%d_pos' % (self.i + 1)], state['pacman_pos'])
+
 class VIRandomGhostAgent(GhostAgent):
     """
     Value iteration ghost agent class that is used in the MDP algorithm.
@@ -156,6 +192,19 @@ class VIRandomGhostAgent(GhostAgent):
         else:
             return self.possible_moves[minn]
 
+    def tile_action(self, state):
+        "Return the action (name) this agent will take in @state, whose positions are tile indices of self.maze."
+        "Same as self.will_move, with the valid moves and the A* action looked up in self.maze."
+        pos = state['ghost%d_pos' % (self.i + 1)]
+        vms = list(self.maze.moves[pos])
+        P = uniform(0, 1)
+        minn = self.maze.first_move(pos, state['pacman_pos'])
+        if P > 0.8 and len(vms) > 1:
+            vms.remove(minn)
+            return choice(vms)
+        else:
+            return minn
+
 class UXGhostAgent(GhostAgent):
     """
     Ghost agent class that aim to enhance user experience, based on the truly used method in original Pacman Game.
@@ -197,11 +246,27 @@ class UXGhostAgent(GhostAgent):
 
     def chasing(self, valid, state):
         "Action to take in chase mode."
-        return self.best_chase(self.position, state['pacman_pos'], valid)
+        return self.field_chase(state['pacman_pos'], valid)
 
     def spreading(self, valid, state):
         "Action to take in spread mode."
-        return self.best_chase(self.position, self.spread_corner(state), valid)
+        return self.field_chase(self.spread_corner(state), valid)
+
+    def field_chase(self, target, valid):
+        "Return the best action to take when chasing @target: the move down the distance field of the game to @target. (see Engine.distance_field)"
+        "Ties are broken by the euclidean distance to @target like the A* heuristic. Off the lattice, fall back to self.best_chase."
+        field = self.game.distance_field(target)
+        k = self.lattice_index(self.position)
+        if field is None or k is None or field[k] == float('inf'):
+            return self.best_chase(self.position, target, valid)
+        best = "stop"
+        bestd = (field[k], 0)
+        for n, nxt in self.game.lattice[k]:
+            d = (field[nxt], distance(self.position + self.possible_moves[n], target))
+            if d < bestd:
+                best = n
+                bestd = d
+        return best
 
     def will_move(self, valid, state):
         "Return the action (move vector) this agent will take in the given state."
@@ -0,0 +1,133 @@
+from IntelligentAgents import * # extend IntelligentAgents module with the batched learner
+from random import getrandbits
+import numpy as np
+
+STEPS = [n for n in LEARNING_MOVES if n != "stop"] # actions of the batched games, in the order of Agent.valid_moves
+
+class BatchLearningGame():
+    """
+    N independent copies of a LearningGame advanced in lockstep, with the whole batch stored in NumPy arrays.
+    Positions are indices into the walkable tiles of the maze, and moves are lookups in the tables of its MazeIndex:
+        pacman[e], ghosts[e, g]: tiles of pacman and the ghosts in game e
+        food[e, t]: whether tile t of game e still has food
+    The games follow the rules of LearningGame with VIRandomGhostAgent ghosts (the ghosts pacman learns against).
+    """
+    def __init__(self, game, n, rng):
+        maze = game.maze
+        self.n = n
+        self.rng = rng
+        self.num_tiles = len(game.tiles) # normalizes the closest food distance like LearningGame.features
+        self.num_ghosts = len(game.ghosts)
+        self.tiles = maze.tiles
+        tile = {idx: t for t, idx in enumerate(self.tiles)}
+        T = len(self.tiles)
+        self.neighbor = np.full((T, len(STEPS)), -1, dtype = np.intp) # neighbor[t, a]: tile reached by action a from tile t, -1 if invalid
+        for t, idx in enumerate(self.tiles):
+            for a, nxt in maze.neighbors[idx]:
+                self.neighbor[t, STEPS.index(a)] = tile[nxt]
+        self.dist = np.array([[maze.distance(src, dst) for dst in self.tiles] for src in self.tiles]) # dist[src, dst]
+        chase = [[maze.first_move(src, dst) for dst in self.tiles] for src in self.tiles]
+        self.chase = np.array([[STEPS.index(a) if a != "stop" else 0 for a in row] for row in chase], dtype = np.intp) # chase[ghost, pacman], only used while they are apart
+        state = game.state
+        self.start_pacman = tile[state["pacman_pos"]]
+        self.start_ghosts = np.array([tile[state["ghost%d_pos" % (i + 1)]] for i in range(self.num_ghosts)], dtype = np.intp)
+        self.start_food = np.array([game.tiles[idx] == 1 for idx in self.tiles])
+        self.pacman = np.empty(n, dtype = np.intp)
+        self.ghosts = np.empty((n, self.num_ghosts), dtype = np.intp)
+        self.food = np.empty((n, T), dtype = bool)
+        self.reset(np.ones(n, dtype = bool))
+
+    def reset(self, games):
+        "Restart the games selected by the boolean mask @games."
+        self.pacman[games] = self.start_pacman
+        self.ghosts[games] = self.start_ghosts
+        self.food[games] = self.start_food
+
+    def valid(self):
+        "Return valid[e, a]: whether action a (index in STEPS) is valid for pacman in game e."
+        return self.neighbor[self.pacman] >= 0
+
+    def features(self):
+        "Return F[e, a, k]: feature k (in the order of LearningGame.features()) of taking action a in game e, like LearningGame.features. (0 for invalid actions)"
+        valid = self.valid()
+        nxt = np.where(valid, self.neighbor[self.pacman], self.pacman[:, None])
+        food_dist = np.where(self.food[:, None, :], self.dist[nxt], np.inf).min(axis = 2)
+        food_dist[np.isinf(food_dist)] = 0 # LearningGame.closest_food returns 0 if there's no food left
+        near = (self.dist[nxt[:, :, None], self.ghosts[:, None, :]] <= 2).sum(axis = 2)
+        eats = (near == 0) & np.take_along_axis(self.food, nxt, axis = 1)
+        F = np.stack([np.ones(nxt.shape), food_dist / self.num_tiles, eats.astype(float), near / self.num_ghosts], axis = 2)
+        return F * valid[:, :, None]
+
+    def qvalues(self, w, F = None):
+        "Return Q[e, a] with the weights @w (array in the order of LearningGame.features()), -inf for invalid actions."
+        F = self.features() if F is None else F
+        return np.where(self.valid(), F @ w, -np.inf)
+
+    def best(self, Q):
+        "Return the best action of every game from @Q. Like LearningAgent.best_of_state, ties go to the action that comes last."
+        return Q.shape[1] - 1 - Q[:, ::-1].argmax(axis = 1)
+
+    def random_actions(self, valid):
+        "Return one action of every game picked uniformly among those where @valid is set."
+        return (self.rng.random(valid.shape) * valid).argmax(axis = 1)
+
+    def step(self, actions):
+        "Move pacman of every game with @actions, then the ghosts, like LearningGame.nextstate('sim_pac') and ('sim_ghost_best_Q')."
+        "@Return: (rewards, ended) arrays of the games."
+        games = np.arange(self.n)
+        self.pacman = self.neighbor[self.pacman, actions]
+        eats = self.food[games, self.pacman]
+        self.food[games, self.pacman] = False
+        rewards = eats.astype(float)
+        lose = (self.ghosts == self.pacman[:, None]).any(axis = 1)
+        win = ~lose & ~self.food.any(axis = 1)
+        alive = ~(lose | win)
+        for g in range(self.num_ghosts):
+            ghost = self.ghosts[:, g]
+            valid = self.neighbor[ghost] >= 0
+            best = self.chase[ghost, self.pacman]
+            others = valid.copy()
+            others[games, best] = False
+            wander = (self.rng.random(self.n) > 0.8) & others.any(axis = 1)
+            aims = np.where(wander, self.random_actions(others), best)
+            self.ghosts[:, g] = np.where(alive, self.neighbor[ghost, aims], ghost)
+        caught = alive & (self.ghosts == self.pacman[:, None]).any(axis = 1)
+        rewards += np.where(lose | caught, -200, np.where(win, 100, -0.1))
+        return rewards, lose | win | caught
+
+class BatchQLearningAgent(ApproximateQLearningAgent):
+    """
+    Approximate Q-learning agent that learns from a BatchLearningGame of self.NUM_GAMES games instead of one game at a time.
+    Every step takes an epsilon-greedy action in all games and makes one weight update with the mean of their TD updates.
+    """
+    NUM_GAMES = 32
+
+    def initialize(self):
+        "Initialize this agent."
+        super().initialize()
+        self.modelfilename = "Q3batch.txt" # learns with other updates than ApproximateQLearningAgent
+
+    def learn(self):
+        "Learn the weights by playing self.num_episodes games, self.NUM_GAMES at a time."
+        env = BatchLearningGame(self.game, self.NUM_GAMES, np.random.default_rng(getrandbits(32)))
+        w = self.Q.w # updated in place
+        games = np.arange(env.n)
+        episodes = 0
+        while episodes < self.num_episodes:
+            F = env.features()
+            valid = env.valid()
+            actions = env.best(env.qvalues(w, F))
+            explore = env.rng.random(env.n) < self.epsilon
+            actions = np.where(explore, env.random_actions(valid), actions)
+            F_sa = F[games, actions]
+            rewards, ended = env.step(actions)
+            diff = rewards + self.gamma * env.qvalues(w).max(axis = 1) - F_sa @ w
+            self.Q.update(self.alpha * diff / env.n, F_sa)
+            if ended.any():
+                env.reset(ended)
+                for _ in range(int(ended.sum())):
+                    if episodes % 100 == 0:
+                        print(self.Q.to_dict())
+                    episodes += 1
+        print("ok")
+        self.save() # save the resulted weights into a file (optional)
@@ -0,0 +1,104 @@
+from turtle import *
+
+SCORE_FONT = ('Times', 8, "bold")
+W_L_FONT = ('Times', 48, "normal")
+
+class Display():
+    """
+    Turtle front-end of a game. This is the only module importing turtle, and only Game loads it when not running in auto mode.
+    """
+    def __init__(self, game):
+        self.game = game
+        self.path = Turtle(visible=False)
+        self.writer = Turtle(visible=False)
+
+    def open(self):
+        "Open the window and start listening to the keyboard."
+        setup(420, 420, 370, 0)
+        listen()
+
+    def bind(self, key, fun):
+        "Call @fun when @key is pressed."
+        onkey(fun, key)
+
+    def schedule(self, fun, t):
+        "Call @fun after @t milliseconds."
+        ontimer(fun, t)
+
+    def mainloop(self):
+        "Hand the control over to the turtle event loop."
+        done()
+
+    def reset(self):
+        "Clear the window and draw the world and the score of the current game state."
+        self.path.home()
+        self.path.clear()
+        self.writer.home()
+        self.writer.clear()
+        hideturtle()
+        tracer(False)
+        self.writer.goto(160, 160)
+        self.writer.color('white')
+        self.writer.write(self.game.state['score'], font = SCORE_FONT)
+        self.world()
+
+    def square(self, x, y):
+        "Draw square using path at (@x, @y)."
+        self.path.up()
+        self.path.goto(x, y)
+        self.path.down()
+        self.path.begin_fill()
+
+        for count in range(4):
+            self.path.forward(20)
+            self.path.left(90)
+
+        self.path.end_fill()
+
+    def world(self):
+        "Draw world using path."
+        bgcolor('black')
+        self.path.color('blue')
+        tiles = self.game.tiles
+        for index in range(len(tiles)):
+            tile = tiles[index]
+            if tile > 0:
+                x, y = self.game.cord(index)
+                self.square(x, y)
+                if tile == 1:
+                    self.path.up()
+                    self.path.goto(x + 10, y + 10)
+                    self.path.dot(5, 'white')
+
+    def draw(self, eaten = None):
+        "Draw the score and the agents of the current game state, covering the food on @eaten (index in tiles) if given."
+        "The positions of the state are converted to pixels here. (see Engine.point)"
+        state = self.game.state
+        self.writer.undo()
+        self.writer.write(state['score'], font = SCORE_FONT)
+
+        clear()
+
+        if eaten is not None:
+            self.square(*(self.game.cord(eaten)))
+
+        up()
+        point = self.game.point(state['pacman_pos'])
+        goto(point.x + 10, point.y + 10)
+        dot(20, 'yellow')
+
+        for i in range(len(self.game.ghosts)):
+            point = self.game.point(state['ghost%d_pos' % (i + 1)])
+            up()
+            goto(point.x + 10, point.y + 10)
+            dot(20, 'red')
+
+        update()
+
+    def message(self, text, color):
+        "Write @text with @color in the middle of the window."
+        self.writer.up()
+        self.writer.home()
+        self.writer.goto(0, -40)
+        self.writer.color(color)
+        self.writer.write(text, align = 'center', font = W_L_FONT)
@@ -0,0 +1,369 @@
+from freegames import vector
+from collections import namedtuple, deque
+from array import array
+from Maze import MazeIndex
+import Agents
+
+Delta = namedtuple("Delta", ["agent", "pos", "eaten", "score", "reward", "end"])
+Delta.__doc__ = """
+Change made to a state by Engine.pacman_apply / Engine.ghosts_apply, which Engine.undo reverts:
+    agent: "pacman" or "ghosts", pos: previous position of pacman (list of previous positions of the ghosts, see Engine.position),
+    eaten: tile index of the food eaten or None, score: previous score, reward: score change, end: end_game of the new state
+"""
+
+class Engine():
+    """
+    Headless simulation core holding the game rules. (Never imports turtle, so it runs without a display)
+    """
+    walkable = None # see self.walkable_map, built by __init__ right after self.initialize() has set the layout
+    tile_positions = False # positions in the states are tile indices if set, else indices of the 5-px lattice (see self.position)
+    def __init__(self, *args, **kwargs):
+        self.initialize()
+        self.walkable = self.walkable_map() # the layout never changes after here, so the tables are built once per game
+        self.lattice = self.lattice_map()
+        self.lattice_tiles = [self.offset(self.lattice_point(k)) for k in range(len(self.walkable))] # tile under every lattice point
+        self.maze = MazeIndex(self)
+        self.row_delta = self.offset(vector(0, 0)) - self.offset(vector(0, 20)) # tiles in a row of the layout
+        self.corner_fields = {} # {lattice index of a corner: distance field}, see self.distance_field
+        self.last_field = (None, None) # (lattice index, distance field) of the last other target
+        self.init_agents(*args, **kwargs)
+
+    def init_agents(self):
+        "Initialize agents, the speed setting here is more suitable for human playing than other games."
+        self.pacman = Agents.KeyboardAgent(self.point(self.state['pacman_pos']))
+        self.pacman.game = self
+        self.ghosts = []
+        for i in range(4):
+            self.ghosts.append(Agents.UXGhostAgent(self, i, self.point(self.state['ghost%d_pos' % (i + 1)])))
+
+    def initialize(self):
+        "Initialize game state."
+        self.tiles = [
+            0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+            0, 1, 1, 1, 1, 1, 1, 1, 0, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0,
+            0, 1, 0, 0, 1, 0, 0, 1, 0, 1, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0,
+            0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0,
+            0, 1, 0, 0, 1, 0, 1, 0, 0, 0, 1, 0, 1, 0, 0, 1, 0, 0, 0, 0,
+            0, 1, 1, 1, 1, 0, 1, 1, 0, 1, 1, 0, 1, 1, 1, 1, 0, 0, 0, 0,
+            0, 1, 0, 0, 1, 0, 0, 1, 0, 1, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0,
+            0, 1, 0, 0, 1, 0, 1, 1, 1, 1, 1, 0, 1, 0, 0, 0, 0, 0, 0, 0,
+            0, 1, 1, 1, 1, 1, 1, 0, 0, 0, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0,
+            0, 0, 0, 0, 1, 0, 1, 1, 1, 1, 1, 0, 1, 0, 0, 1, 0, 0, 0, 0,
+            0, 0, 0, 0, 1, 0, 1, 0, 0, 0, 1, 0, 1, 0, 0, 1, 0, 0, 0, 0,
+            0, 1, 1, 1, 1, 1, 1, 1, 0, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0,
+            0, 1, 0, 0, 1, 0, 0, 1, 0, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0,
+            0, 1, 1, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 1, 1, 0, 0, 0, 0,
+            0, 0, 1, 0, 1, 0, 1, 0, 0, 0, 1, 0, 1, 0, 1, 0, 0, 0, 0, 0,
+            0, 1, 1, 1, 1, 0, 1, 1, 0, 1, 1, 0, 1, 1, 1, 1, 0, 0, 0, 0,
+            0, 1, 0, 0, 0, 0, 0, 1, 0, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0,
+            0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0,
+            0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+            0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0
+        ]
+        self.state = {'score': 0, 'pacman_pos': self.position(vector(-40, -80)),
+                            'ghost1_pos': self.position(vector(-180, 160)),
+                            'ghost2_pos': self.position(vector(-180, -160)),
+                            'ghost3_pos': self.position(vector(100, 160)),
+                            'ghost4_pos': self.position(vector(100, -160)),
+                            'food_num': self.tiles.count(1),
+                            'tiles': self.tiles.copy()}
+        self.corners = [
+            vector(-180, 160),
+            vector(-180, -160),
+            vector(100, 160),
+            vector(100, -160)
+        ]
+
+    def reposition_agents(self):
+        "Reset the position of the agents."
+        self.pacman.position = self.point(self.state['pacman_pos']).copy()
+        for i in range(len(self.ghosts)):
+            self.ghosts[i].position = self.point(self.state['ghost%d_pos' % (i + 1)]).copy()
+
+    def position(self, point):
+        "Return the position of the pixel @point in the states: its tile index if self.tile_positions is set, else its index in the 5-px lattice. (see self.lattice_index)"
+        "Agents of the games with tile positions move one tile at a time, the keyboard pacman and the ghosts of this game stop between tiles."
+        if self.tile_positions:
+            return self.offset(point)
+        return self.lattice_index(point)
+
+    def point(self, pos):
+        "Return the pixel vector of the position @pos of a state, for the agents and the display. Don't modify the returned vector."
+        if self.tile_positions:
+            return self.maze.points[pos]
+        return self.lattice_point(pos)
+
+    def delta(self, aim):
+        "Return the change of position made by the move vector @aim. (a multiple of 20 px if self.tile_positions is set)"
+        if self.tile_positions:
+            return int(aim.x // 20 - aim.y // 20 * self.row_delta)
+        return int(aim.x // 5 * 80 + aim.y // 5)
+
+    def tile_of(self, pos):
+        "Return the tile index under the position @pos."
+        if self.tile_positions:
+            return pos
+        return self.lattice_tiles[pos]
+
+    def collide(self, pos1, pos2):
+        "Return whether agents at the positions @pos1 and @pos2 are closer than 20 px, which ends a game."
+        if self.tile_positions:
+            return pos1 == pos2 # tiles are 20 px apart
+        (i1, j1), (i2, j2) = divmod(pos1, 80), divmod(pos2, 80)
+        return (i1 - i2) ** 2 + (j1 - j2) ** 2 < 16
+
+    def offset(self, point):
+        "Return offset of @point in tiles."
+        "Same as flooring @point to its tile with freegames.floor, in integer arithmetic."
+        return int((point.x + 200) // 20 + (19 - (point.y + 200) // 20) * 20)
+
+    def cord(self, index):
+        "Return coordinate of @index in tiles"
+        x = (index % 20) * 20 - 200
+        y = 180 - (index // 20) * 20
+        return x, y
+
+    def walkable_map(self):
+        "Return walkable[i * 80 + j]: whether the point (5i - 200, 5j - 200) is valid (see self.walkable_at), for the 80 x 80 points of the 5-px lattice over the board."
+        "Points whose tiles are out of the layout (see self.on_layout) are not walkable."
+        walkable = bytearray(80 * 80)
+        for i in range(80):
+            for j in range(80):
+                point = vector(5 * i - 200, 5 * j - 200)
+                if self.on_layout(point) and self.on_layout(point + 19):
+                    walkable[i * 80 + j] = self.walkable_at(point)
+        return walkable
+
+    def on_layout(self, point):
+        "Return whether the tile under @point is in the layout. (self.offset of a point beside it wraps around into another row, or out of self.tiles)"
+        index = self.offset(point)
+        if not 0 <= index < len(self.tiles):
+            return False
+        x, y = self.cord(index)
+        return x <= point.x < x + 20 and y <= point.y < y + 20
+
+    def valid(self, point):
+        "Return True if @point is valid in tiles."
+        "Points of the 5-px lattice the agents move on are looked up in self.walkable, others are checked by self.walkable_at."
+        k = self.lattice_index(point) if self.walkable is not None else None
+        if k is None:
+            return self.walkable_at(point)
+        return self.walkable[k] == 1
+
+    def lattice_index(self, point):
+        "Return the index of @point in self.walkable, None if @point is not a point of the 5-px lattice over the board."
+        x, y = point.x, point.y
+        if -200 <= x < 200 and -200 <= y < 200 and x % 5 == 0 and y % 5 == 0:
+            return int((x + 200) // 5 * 80 + (y + 200) // 5)
+        return None
+
+    def lattice_point(self, k):
+        "Return the point with index @k in self.walkable. (see self.lattice_index)"
+        return vector(5 * (k // 80) - 200, 5 * (k % 80) - 200)
+
+    def lattice_map(self):
+        "Return [[(action, index)]]: the valid 5-px moves (Agents.MOVES) from every point of self.walkable, in the order of Agent.valid_moves."
+        steps = {'up': (0, 1), 'left': (-1, 0), 'down': (0, -1), 'right': (1, 0)}
+        lattice = [[] for _ in range(len(self.walkable))]
+        for k in range(len(self.walkable)):
+            if not self.walkable[k]:
+                continue
+            i, j = divmod(k, 80)
+            for n in Agents.MOVES:
+                if n == 'stop':
+                    continue
+                ni, nj = i + steps[n][0], j + steps[n][1]
+                if 0 <= ni < 80 and 0 <= nj < 80 and self.walkable[ni * 80 + nj]:
+                    lattice[k].append((n, ni * 80 + nj))
+        return lattice
+
+    def distance_field(self, target):
+        "Return field[k]: the number of 5-px moves from point k of self.walkable to @target (inf if unreachable), None if @target is off the lattice."
+        """
+        The field is one BFS from @target, which every ghost heading there reads its moves from. Fields to self.corners are kept
+        for the whole game and the field to any other target (pacman) until another one is asked for,
+        so a tick searches once from pacman however many ghosts chase him.
+        """
+        key = self.lattice_index(target)
+        if key is None:
+            return None
+        if key in self.corner_fields:
+            return self.corner_fields[key]
+        if self.last_field[0] == key:
+            return self.last_field[1]
+        field = array('d', [float('inf')]) * len(self.walkable)
+        field[key] = 0
+        q = deque([key])
+        while q:
+            cnt = q.popleft()
+            for _, nxt in self.lattice[cnt]:
+                if field[nxt] == float('inf'):
+                    field[nxt] = field[cnt] + 1
+                    q.append(nxt)
+        if target in self.corners:
+            self.corner_fields[key] = field
+        else:
+            self.last_field = (key, field)
+        return field
+
+    def walkable_at(self, point):
+        "Return True if @point is valid in tiles, computed from the tiles under it."
+        index = self.offset(point)
+
+        if self.tiles[index] == 0:
+            return False
+
+        index = self.offset(point + 19)
+
+        if self.tiles[index] == 0:
+            return False
+
+        return point.x % 20 == 0 or point.y % 20 == 0
+
+    def nextstate(self, agent, param1, param2):
+        "Return the updated state for the given @agent and action(@param1, @param2)."
+        if agent == "none": # deprecated
+            return self.state
+        else:
+            raise KeyError("invalid agent")
+
+    def copy_state(self, state):
+        "Return a copy of @state which self.pacman_apply and self.ghosts_apply can change without touching @state."
+        state = dict(state)
+        state['tiles'] = list(state['tiles'])
+        return state
+
+    def eat(self, state, index):
+        "Eat the food on tile @index of @state in place, if there is any."
+        "@Return: whether there was food."
+        tiles = state['tiles']
+        if tiles[index] != 1:
+            return False
+        tiles[index] = 2
+        state['score'] += 1
+        state['food_num'] -= 1
+        return True
+
+    def uneat(self, state, index):
+        "Put the food eaten on tile @index back into @state. (the score is restored by self.undo)"
+        state['tiles'][index] = 1
+        state['food_num'] += 1
+
+    def food_left(self, state):
+        "Return the number of food left in @state."
+        return state['food_num']
+
+    def ghosts_score(self, state, end):
+        "Update the score of @state in place after the ghosts moved and the game is in @end (see self.end_game)."
+        if end == 1:
+            state['score'] -= 200
+
+    def pacman_apply(self, state, move):
+        "Move pacman of @state in place with the valid action (@move, a change of position, see self.delta), eating and scoring like self.pacman_step."
+        "@Return: the Delta that self.undo takes to revert it."
+        pos = state['pacman_pos']
+        score = state['score']
+        state['pacman_pos'] = pos + move
+        index = self.tile_of(state['pacman_pos'])
+        eaten = index if self.eat(state, index) else None
+
+        end = self.end_game(state)
+        if end == 2:
+            state['score'] += 100
+        elif end == 1:
+            state['score'] -= 200
+        return Delta("pacman", pos, eaten, score, state['score'] - score, end)
+
+    def ghosts_apply(self, state, moves):
+        "Move every ghost of @state in place with its valid action (@moves[i] for ghost i, see self.delta), scoring like self.ghosts_step."
+        "@Return: the Delta that self.undo takes to revert it."
+        pos = [state['ghost%d_pos' % (i + 1)] for i in range(len(moves))]
+        score = state['score']
+        for i, move in enumerate(moves):
+            state['ghost%d_pos' % (i + 1)] = pos[i] + move
+
+        end = self.end_game(state)
+        self.ghosts_score(state, end)
+        return Delta("ghosts", pos, None, score, state['score'] - score, end)
+
+    def undo(self, state, delta):
+        "Revert the change @delta made to @state in place. Deltas have to be undone in the reverse order they were applied."
+        if delta.agent == "pacman":
+            state['pacman_pos'] = delta.pos
+        else:
+            for i, pos in enumerate(delta.pos):
+                state['ghost%d_pos' % (i + 1)] = pos
+        if delta.eaten is not None:
+            self.uneat(state, delta.eaten)
+        state['score'] = delta.score
+
+    def pacman_step(self, state, move):
+        "Return the state after pacman takes the valid action (@move, see self.delta) from @state."
+        state = self.copy_state(state)
+        self.pacman_apply(state, move)
+        return state
+
+    def ghosts_step(self, state, moves):
+        "Return the state after every ghost takes its valid action (@moves[i] for ghost i, see self.delta) from @state."
+        state = self.copy_state(state)
+        self.ghosts_apply(state, moves)
+        return state
+
+    def agents_view(self, state):
+        "Return a copy of @state with the positions as pixel vectors, which is how the ghost agents read a state."
+        view = dict(state)
+        for key in state:
+            if key.endswith('_pos'):
+                view[key] = self.point(state[key])
+        return view
+
+    def ghosts_will_move(self, state):
+        "Return the actions (move vectors) the ghost agents will take in the given @state."
+        "With self.tile_positions the ghosts read the tile indices of @state directly. (see Agents.GhostAgent.tile_action)"
+        if self.tile_positions:
+            return [g.possible_moves[g.tile_action(state)] for g in self.ghosts]
+        view = self.agents_view(state)
+        aims = []
+        for i, g in enumerate(self.ghosts):
+            temp = g.position
+            g.position = view['ghost%d_pos' % (i + 1)]
+            aims.append(g.will_move(self.valid, view))
+            g.position = temp
+        return aims
+
+    def step(self, state, pacman_action, ghost_actions = None):
+        """
+        Advance @state by one time unit: pacman takes @pacman_action, then ghost i takes @ghost_actions[i]. (move vectors)
+        If @ghost_actions is None, the ghost agents choose their actions after pacman has moved.
+        Invalid actions are treated as 'stop'. @state itself is left untouched.
+        @Return: (next state, reward, done)
+        """
+        stop = Agents.MOVES['stop']
+        if not self.valid(self.point(state['pacman_pos']) + pacman_action):
+            pacman_action = stop
+        ns = self.pacman_step(state, self.delta(pacman_action))
+
+        if self.end_game(ns) == 0:
+            if ghost_actions is None:
+                ghost_actions = self.ghosts_will_move(ns)
+            moves = []
+            for i, aim in enumerate(ghost_actions):
+                if not self.valid(self.point(ns['ghost%d_pos' % (i + 1)]) + aim):
+                    aim = stop
+                moves.append(self.delta(aim))
+            ns = self.ghosts_step(ns, moves)
+
+        return ns, ns['score'] - state['score'], self.end_game(ns) != 0
+
+    def end_game(self, state = None):
+        """
+        Return if a game (in @state) is ended.
+        @Return: 1 for losing, 2 for winning, 0 for not ended
+        """
+        state = self.state if state is None else state
+        for i in range(len(self.ghosts)):
+            if self.collide(state['pacman_pos'], state['ghost%d_pos' % (i + 1)]):
+                return 1
+        if self.food_left(state) == 0:
+            return 2
+        return 0
@@ -1,4 +1,9 @@
 from Agents import * # extend Agents module and let Game treat this as Agents
+from array import array
+from utils import PriorityQueue
+import ModelFile
+
+ACTIONS = list(MOVES) # policies store actions as indices into this list
 
 class IntelligentAgent(PacmanAgent):
     """
@@ -12,18 +17,25 @@ class IntelligentAgent(PacmanAgent):
         "Return if this is a keyboard agent."
         return False
 
+    def state_moves(self, state):
+        "Return the valid actions of pacman in @state, where positions are tile indices. (see Engine.tile_positions)"
+        return list(self.maze.moves[state["pacman_pos"]])
+
 class MDPAgent(IntelligentAgent):
     """
     Abstract pacman agent class used to solve MDP.
     """
+    IN_PLACE = False # Gauss-Seidel sweeps: update the values in place instead of into a second buffer
+
     def __init__(self, game, gamma, *args):
         super().__init__(*args)
         self.game = game
         self.gamma = gamma # discount factor
+        self.maze = game.maze
         self.initialize()
         try:
             self.load()
-        except FileNotFoundError:
+        except (FileNotFoundError, ModelFile.ModelMismatch):
             self.plan()
     
     def hash_state(self, state):
@@ -44,12 +56,19 @@ class MDPAgent(IntelligentAgent):
             yield T(s, a, s'), s'
         """
         "YOUR CODE HERE"
-        vms = self.valid_moves(state["ghost1_pos"], self.game.valid)
-        for a in vms:
+        for a, prob in self.ghost_responses(state):
             ns = self.game.nextstate("sim_ghost", self.possible_moves[a], state)
-            prob = self.probability(state, a, len(vms))
             yield prob, ns
 
+    def ghost_responses(self, state):
+        "Return the valid ghost actions and their probabilities [(a, T)] in the Q-state @state."
+        "They only depend on the ghost and pacman tiles, so they are computed once per tile pair and kept in self.game.ghost_model, which all agents and evaluations of the game share."
+        key = (state["ghost1_pos"], state["pacman_pos"])
+        if key not in self.game.ghost_model:
+            vms = list(self.maze.moves[state["ghost1_pos"]])
+            self.game.ghost_model[key] = [(a, self.probability(state, a, len(vms))) for a in vms]
+        return self.game.ghost_model[key]
+
     def probability(self, Qstate, ghost_action, number_of_valid_ghost_actions):
         "Return the probability for one nextstate (s') given @Qstate and @ghost_action."
         "@number_of_valid_ghost_actions can be used to evaluate the probability."
@@ -61,7 +80,7 @@ class MDPAgent(IntelligentAgent):
         "YOUR CODE HERE"
         if number_of_valid_ghost_actions == 1:
             return 1
-        best_action = self.best_chase(Qstate["ghost1_pos"], Qstate["pacman_pos"], self.game.valid)
+        best_action = self.maze.first_move(Qstate["ghost1_pos"], Qstate["pacman_pos"]) # what self.best_chase finds between tiles
         if best_action == ghost_action:
             return 0.8
         else:
@@ -72,8 +91,99 @@ class MDPAgent(IntelligentAgent):
         "One of ['stop', 'up', 'down', 'left', 'right']"
         "If there are more than one actions with max Q-value, randomly pick one. (use choice(actions))"
         "YOUR CODE HERE"
-        action = self.V[self.hash_state(state)]["action"]
-        return action
+        action = ACTIONS[self.P[self.game.state_index(state)]]
+        return self.game.mirror_action(state, action)
+
+    def init_tables(self, action):
+        "Initialize the value table (self.V) and the policy table (self.P, default to @action) indexed by self.game.state_index."
+        n = self.game.num_states()
+        self.V = array('d', bytes(8 * n))
+        self.P = array('B', [ACTIONS.index(action)]) * n
+        self.back_V = None if self.IN_PLACE else array('d', bytes(8 * n)) # receives the values of the next sweep
+        self.state_models = None # see self.compiled_model
+
+    def next_values(self):
+        "Start a sweep: return the values to back up from, and make self.V the buffer receiving the new values."
+        "The two value buffers are swapped instead of copying the values. With self.IN_PLACE the values are updated in place, so a sweep uses every new value as soon as it is computed."
+        if self.IN_PLACE:
+            return self.V
+        old_V = self.V
+        self.V, self.back_V = self.back_V, old_V
+        return old_V
+
+    def from_dict(self, V):
+        "Fill the tables from @V, a dictionary of {hashed state: {'value', 'action'}} (the model text format)."
+        for i, s in enumerate(self.game.allstates()):
+            entry = V[self.hash_state(self.game.text_state(s))]
+            self.V[i] = entry["value"]
+            self.P[i] = ACTIONS.index(entry["action"])
+
+    def load(self):
+        "Load model file into this object."
+        "The binary model is memory mapped. Text models (self.textfilename) are only converted on request by ModelFile.main, since nothing in them tells which ghost model they were planned with."
+        self.V, self.P = ModelFile.load(self.game.modelpath(self.modelfilename), self.game.fingerprint(), self.gamma)
+
+    @classmethod
+    def from_text(cls, game, gamma):
+        "Return an agent of this class for @game with the tables read from its text model (self.textfilename)."
+        "The agent is built as usual, so it loads its binary model or plans first. Raise FileNotFoundError if there is no text model."
+        agent = cls(game, gamma, game.point(game.state['pacman_pos']))
+        if agent.textfilename is None:
+            raise FileNotFoundError("%s has no text model" % cls.__name__)
+        with open(agent.textfilename, "r") as f:
+            V = eval(f.read())
+        agent.initialize() # new tables, the loaded ones are mapped from the binary model
+        agent.from_dict(V)
+        return agent
+
+    def save(self):
+        "Save the policy into a model file."
+        ModelFile.save(self.game.modelpath(self.modelfilename), self.game.fingerprint(), self.gamma, self.V, self.P)
+
+    def transitions(self, s):
+        "Return [(a, [(T(s, a, s'), index of s', R(s, a, s'))])] for every valid action a of the non-terminal state @s."
+        "The outcomes are listed in the same order the planners sum them in."
+        "Every successor is visited by applying the moves to @s in place and undoing them, so no state is copied."
+        result = []
+        for a, pc in self.maze.neighbors[s["pacman_pos"]]:
+            pacman = self.game.pacman_apply(s, pc - s["pacman_pos"])
+            if pacman.end == 0:
+                outcomes = []
+                for ga, prob in self.ghost_responses(s):
+                    ghost = self.game.ghosts_apply(s, [self.game.delta(self.possible_moves[ga])])
+                    outcomes.append((prob, self.game.state_index(s), pacman.reward + ghost.reward))
+                    self.game.undo(s, ghost)
+            else:
+                outcomes = [(1, self.game.state_index(s), -200 if pacman.end == 1 else 100)]
+            self.game.undo(s, pacman)
+            result.append((a, outcomes))
+        return result
+
+    def state_model(self, s):
+        "Return the value of @s if it's an end state, else self.transitions(@s)."
+        end = self.game.end_game(s)
+        if end != 0:
+            return -200 if end == 1 else 100
+        return self.transitions(s)
+
+    def bellman_residual(self):
+        "Return the largest |Max(a)[Q(s, a)] - V(s)| over the states, with Q(s, a) computed from self.V by one step look ahead."
+        "It's small only if self.V are the values of the current game and ghost model."
+        residual = 0
+        for i, model in enumerate(self.compiled_model()):
+            if not isinstance(model, list): # end state
+                residual = max(residual, abs(model - self.V[i]))
+                continue
+            V = max(sum(prob*(R + self.gamma*self.V[j]) for prob, j, R in outcomes) for a, outcomes in model)
+            residual = max(residual, abs(V - self.V[i]))
+        return residual
+
+    def compiled_model(self):
+        "Return [self.state_model(s)] of every state s in the order of self.game.allstates(), compiled the first time it's asked for."
+        "So the sweeps read the successors from these lists instead of building the successor states again every sweep."
+        if self.state_models is None:
+            self.state_models = [self.state_model(s) for s in self.game.allstates()]
+        return self.state_models
 
     def will_move(self, valid, state):
         "Return the action (move vector) this agent will take in the given @state."
@@ -90,26 +200,13 @@ class ValueIterationAgent(MDPAgent):
     """
     Pacman agent class that constructs a policy of a given world with value iteration before the game starts.
     """
-    def load(self):
-        "Load model file into this object."
-        "It would be convenient if you save the policy into a file so that you don't need to plan again the next time you start a game."
-        with open(self.modelfilename, "r") as f:
-            self.V = eval(f.read())
-            "YOUR CODE HERE (OPTIONAL)"
-
-    def save(self):
-        "Save the policy into a model file."
-        "It would be convenient if you save the policy into a file so that you don't need to plan again the next time you start a game."
-        with open(self.modelfilename, "w") as f:
-            f.write(str(self.V))
-            "YOUR CODE HERE (OPTIONAL)"
-
     def initialize(self):
         "Initialize this agent."
-        self.modelfilename = "Q1.txt" # replace this if you implement the save & load methods
+        self.modelfilename = "Q1.mdp"
+        self.textfilename = "Q1.txt" # model in the old text format, converted by ModelFile.main
         "PLACE ANY INITIALIZATION CODE THAT YOU NEED HERE"
         "And you probably wanna initialize the data structure storing state values and policy here."
-        self.V = {self.hash_state(s): {"value": 0, "action": "stop"} for s in self.game.allstates()}
+        self.init_tables("stop")
         
     def iteration(self):
         "Update the state values (probably also policy) with one step look ahead."
@@ -121,33 +218,20 @@ class ValueIterationAgent(MDPAgent):
             You can check that by self.game.end_game(state), and in those cases, there will be no s'.
         """
         "@Return: total difference of the state values for convergence checking."
-        old_V = deepcopy(self.V)
+        old_V = self.next_values()
         delta = 0
-        for s in self.game.allstates():
-            if self.game.end_game(s) == 1:
-                delta = delta + abs(-200 - old_V[self.hash_state(s)]["value"])
-                self.V[self.hash_state(s)]["value"] = -200
-                continue
-            elif self.game.end_game(s) == 2:
-                delta = delta + abs(100 - old_V[self.hash_state(s)]["value"])
-                self.V[self.hash_state(s)]["value"] = 100
+        for i, model in enumerate(self.compiled_model()):
+            if not isinstance(model, list): # end state
+                delta = delta + abs(model - old_V[i])
+                self.V[i] = model
                 continue
             V = 0
             n = 0
             action = "stop"
-            for a in self.valid_moves(s["pacman_pos"], self.game.valid):
+            for a, outcomes in model:
                 V_new = 0
-                Qstate = self.game.nextstate("sim_pac", self.possible_moves[a], s)
-                if self.game.end_game(Qstate) == 0:
-                    for prob, s_new in self.possible_nextstate(Qstate):
-                        R = s_new["score"] - s["score"]
-                        V_new = V_new + prob*(R + self.gamma*old_V[self.hash_state(s_new)]["value"])
-                elif self.game.end_game(Qstate) == 1:
-                    R = -200
-                    V_new = V_new + 1*(R + self.gamma*old_V[self.hash_state(Qstate)]["value"])
-                elif self.game.end_game(Qstate) == 2:
-                    R = 100
-                    V_new = V_new + 1*(R + self.gamma*old_V[self.hash_state(Qstate)]["value"])
+                for prob, j, R in outcomes:
+                    V_new = V_new + prob*(R + self.gamma*old_V[j])
                 if n == 0:
                     V = V_new
                     action = a
@@ -155,9 +239,9 @@ class ValueIterationAgent(MDPAgent):
                 elif V_new >= V:
                     V = V_new
                     action = a
-            delta = delta + abs(V - old_V[self.hash_state(s)]["value"])
-            self.V[self.hash_state(s)]["value"] = V
-            self.V[self.hash_state(s)]["action"] = action
+            delta = delta + abs(V - old_V[i])
+            self.V[i] = V
+            self.P[i] = ACTIONS.index(action)
         return delta
 
     def plan(self):
@@ -177,31 +261,109 @@ class ValueIterationAgent(MDPAgent):
             print(i," ",delta)
         self.save() # save the resulted policy into a file (optional)
 
-class PolicyIterationAgent(MDPAgent):
+class GaussSeidelValueIterationAgent(ValueIterationAgent):
     """
-    Pacman agent class that constructs a policy of a given world with policy iteration before the game starts.
+    Value iteration agent with Gauss-Seidel sweeps: a backup already uses the new values of the states before it in the sweep.
+    It needs one value buffer instead of two and usually fewer sweeps.
     """
-    def load(self):
-        "Load model file into this object."
-        "It would be convenient if you save the policy into a file so that you don't need to plan again the next time you start a game."
-        with open(self.modelfilename, "r") as f:
-            self.V = eval(f.read())
-            "YOUR CODE HERE (OPTIONAL)"
+    IN_PLACE = True
 
-    def save(self):
-        "Save the policy into a model file."
-        "It would be convenient if you save the policy into a file so that you don't need to plan again the next time you start a game."
-        with open(self.modelfilename, "w") as f:
-            f.write(str(self.V))
-            "YOUR CODE HERE (OPTIONAL)"
+    def initialize(self):
+        "Initialize this agent."
+        super().initialize()
+        self.modelfilename = "Q1gs.mdp" # converges to slightly different values than ValueIterationAgent
+        self.textfilename = None
+
+class PrioritizedSweepingAgent(ValueIterationAgent):
+    """
+    Pacman agent class that constructs a policy with prioritized sweeping instead of full sweeps.
+    Only the states whose successors changed are backed up again, most urgent (largest Bellman error) first.
+    """
+    IN_PLACE = True # plan() backs up single states in place
+    def initialize(self):
+        "Initialize this agent."
+        super().initialize()
+        self.modelfilename = "Q1sweep.mdp" # backups run in a different order, so tied actions may differ from ValueIterationAgent
+        self.textfilename = None
+        self.backups = 0 # number of Bellman backups done by plan()
 
+    def backup(self, i):
+        "Return (max Q-value, best action) of state @i from the current state values."
+        V = None
+        for a, outcomes in self.model[i]:
+            V_new = 0
+            for prob, j, R in outcomes:
+                V_new = V_new + prob*(R + self.gamma*self.V[j])
+            if V is None or V_new >= V:
+                V = V_new
+                action = a
+        self.backups += 1
+        return V, action
+
+    def plan(self):
+        "Construct the policy from the information given by self.game."
+        """
+        Compile every state's transitions once and index the predecessors of every state.
+        Queue every state by its Bellman error |Max(a)[Q(s, a)] - V(s)|, then repeatedly back up the state with the largest error.
+        When V(s') changes, the error of every predecessor s of s' is computed again and s is queued if it's above the threshold.
+        So every error above 0.01 / (number of states) is queued until it's backed up, and when the queue runs out none is left:
+        the total change of a full sweep would be at most the 0.01 that ValueIterationAgent.plan stops at,
+        and no value is further than 0.01 / (number of states) / (1 - gamma) from the optimal one.
+        """
+        self.model = {}
+        pred = {}
+        for i, s in enumerate(self.game.allstates()):
+            end = self.game.end_game(s)
+            if end != 0:
+                self.V[i] = -200 if end == 1 else 100
+                continue
+            self.model[i] = self.transitions(s)
+            for a, outcomes in self.model[i]:
+                for prob, j, R in outcomes:
+                    pred.setdefault(j, set()).add(i)
+        theta = 0.01 / self.game.num_states()
+        pq = PriorityQueue()
+        priority = {}
+        for i in self.model:
+            error = abs(self.backup(i)[0] - self.V[i])
+            if error > theta:
+                priority[i] = error
+                pq.push((-error, i))
+        while True:
+            try:
+                error, i = pq.pop()
+            except IndexError:
+                break
+            if priority.get(i) != -error:
+                continue # stale entry, the state was requeued or backed up since
+            del priority[i]
+            V, action = self.backup(i)
+            self.P[i] = ACTIONS.index(action)
+            if V == self.V[i]:
+                continue
+            self.V[i] = V
+            for p in pred.get(i, ()):
+                error = abs(self.backup(p)[0] - self.V[p])
+                if error > theta:
+                    priority[p] = error
+                    pq.push((-error, p))
+                else:
+                    priority.pop(p, None) # no longer needs a backup
+        print("backups: ", self.backups)
+        self.save() # save the resulted policy into a file (optional)
+
+class PolicyIterationAgent(MDPAgent):
+    """
+    Pacman agent class that constructs a policy of a given world with policy iteration before the game starts.
+    """
 
     def initialize(self):
         "Initialize this agent."
-        self.modelfilename = "Q2.txt" # replace this if you implement the save & load methods
+        self.modelfilename = "Q2.mdp"
+        self.textfilename = "Q2.txt" # model in the old text format, converted by ModelFile.main
         "PLACE ANY INITIALIZATION CODE THAT YOU NEED HERE"
         "And you probably wanna initialize the data structure storing state values and policy here."
-        self.V = {self.hash_state(s): {"value": 0, "action": "up"} for s in self.game.allstates()}
+        self.init_tables("up")
 
     def policyevaluation(self):
         "Evaluate the state value due to the current policy."
@@ -212,36 +374,21 @@ class PolicyIterationAgent(MDPAgent):
             You can check that by self.game.end_game(state), and in those cases, there will be no s'.
         """
         "YOUR CODE HERE"
-        old_V = deepcopy(self.V)
-        for s in self.game.allstates():
-            if self.game.end_game(s) == 1:
-                self.V[self.hash_state(s)]["value"] = -200
+        old_V = self.next_values()
+        for i, model in enumerate(self.compiled_model()):
+            if not isinstance(model, list): # end state
+                self.V[i] = model
                 continue
-            elif self.game.end_game(s) == 2:
-                self.V[self.hash_state(s)]["value"] = 100
-                continue
-            a = old_V[self.hash_state(s)]["action"]
-            check = 0
-            for valid_a in self.valid_moves(s["pacman_pos"], self.game.valid):
+            a = ACTIONS[self.P[i]]
+            outcomes = model[0][1] # the first valid action if the policy action is invalid
+            for valid_a, valid_outcomes in model:
                 if valid_a == a:
-                    check = 1
+                    outcomes = valid_outcomes
                     break
-            if check == 0:
-                pa = self.valid_moves(s["pacman_pos"], self.game.valid)
-                a = pa[0]
-            Qstate = self.game.nextstate("sim_pac", self.possible_moves[a], s)
             V_new = 0
-            if self.game.end_game(Qstate) == 1:
-                R = -200
-                V_new = V_new + 1*(R + self.gamma*old_V[self.hash_state(Qstate)]["value"])
-            elif self.game.end_game(Qstate) == 2:
-                R = 100
-                V_new = V_new + 1*(R + self.gamma*old_V[self.hash_state(Qstate)]["value"])
-            else:
-                for prob, s_new in self.possible_nextstate(Qstate):
-                    R = s_new["score"] - s["score"]
-                    V_new = V_new + prob*(R + self.gamma*old_V[self.hash_state(s_new)]["value"])
-            self.V[self.hash_state(s)]["value"] = V_new
+            for prob, j, R in outcomes:
+                V_new = V_new + prob*(R + self.gamma*old_V[j])
+            self.V[i] = V_new
             
     def policyextraction(self):
         "Extract the policy from the updated state values by self.policyextraction."
@@ -253,31 +400,18 @@ class PolicyIterationAgent(MDPAgent):
         """
         "@Return: whether the policy's different from the last one for convergence checking."
         "YOUR CODE HERE"
-        old_action = deepcopy(self.V)
         temp = 0
-        for s in self.game.allstates():
-            if self.game.end_game(s) == 1:
-                temp = temp + 1
-                continue
-            elif self.game.end_game(s) == 2:
+        for i, model in enumerate(self.compiled_model()):
+            if not isinstance(model, list): # end state
                 temp = temp + 1
                 continue
             n = 0
             V = 0
             action = "stop"
-            for a in self.valid_moves(s["pacman_pos"], self.game.valid):
+            for a, outcomes in model:
                 V_new = 0
-                Qstate = self.game.nextstate("sim_pac", self.possible_moves[a], s)
-                if self.game.end_game(Qstate) == 1:
-                    R = -200
-                    V_new = V_new + 1*(R + self.gamma*old_action[self.hash_state(Qstate)]["value"])
-                elif self.game.end_game(Qstate) == 2:
-                    R = 100
-                    V_new = V_new + 1*(R + self.gamma*old_action[self.hash_state(Qstate)]["value"])
-                else:
-                    for prob, s_new in self.possible_nextstate(Qstate):
-                        R = s_new["score"] - s["score"]
-                        V_new = V_new + prob*(R + self.gamma*old_action[self.hash_state(s_new)]["value"])
+                for prob, j, R in outcomes:
+                    V_new = V_new + prob*(R + self.gamma*self.V[j])
                 if n == 0:
                     V = V_new
                     action = a
@@ -285,13 +419,13 @@ class PolicyIterationAgent(MDPAgent):
                 elif V_new >= V:
                     V = V_new
                     action = a
-            self.V[self.hash_state(s)]["action"] = action
-            if action == old_action[self.hash_state(s)]["action"]:
+            if self.P[i] == ACTIONS.index(action):
                 temp = temp + 1
             else:
+                self.P[i] = ACTIONS.index(action)
                 change = False
         print(temp)
-        if temp == 9216:
+        if temp == self.game.num_states():
             print(temp)
             change = True
         return change
@@ -319,6 +453,18 @@ class PolicyIterationAgent(MDPAgent):
             print(i," ",change)
         self.save() # save the resulted policy into a file (optional)
 
+class GaussSeidelPolicyIterationAgent(PolicyIterationAgent):
+    """
+    Policy iteration agent whose evaluation sweeps are Gauss-Seidel sweeps, see GaussSeidelValueIterationAgent.
+    """
+    IN_PLACE = True
+
+    def initialize(self):
+        "Initialize this agent."
+        super().initialize()
+        self.modelfilename = "Q2gs.mdp" # evaluates the policies differently, so it may converge to another policy than PolicyIterationAgent
+        self.textfilename = None
+
 class LearningAgent(IntelligentAgent):
     """
     Abstract pacman agent class for reinforcement learning.
@@ -330,6 +476,7 @@ class LearningAgent(IntelligentAgent):
         self.epsilon = epsilon # exploration rate
         self.game = game
         self.gamma = gamma # discount factor
+        self.maze = game.maze
         self.initialize()
         try:
             self.load()
@@ -345,8 +492,7 @@ class LearningAgent(IntelligentAgent):
         "If there are more than one actions with max Q-value, randomly pick one. (use choice(actions))"
         "YOUR CODE HERE"
         n = 0
-        for a in self.valid_moves(state["pacman_pos"], self.game.valid):
-            Q = self.get_Qvalue(state, a)
+        for a, Q in self.get_Qvalues(state):
             if n == 0:
                 maxQ = Q
                 action = a
@@ -356,6 +502,10 @@ class LearningAgent(IntelligentAgent):
                 action = a
         return action
 
+    def get_Qvalues(self, state):
+        "Return [(a, Q(@state, a))] for every valid action a of @state."
+        return [(a, self.get_Qvalue(state, a)) for a in self.state_moves(state)]
+
     def will_move(self, valid, state):
         "Return the action (move vector) this agent will take in the given @state."
         """
@@ -372,14 +522,14 @@ class ApproximateQLearningAgent(LearningAgent):
         "Load model file into this object."
         "It would be convenient if you save the policy into a file so that you don't need to plan again the next time you start a game."
         with open(self.modelfilename, "r") as f:
-            self.w = eval(f.read())
+            self.Q.from_dict(eval(f.read()))
             "YOUR CODE HERE (OPTIONAL)"
 
     def save(self):
         "Save the policy into a model file."
         "It would be convenient if you save the policy into a file so that you don't need to plan again the next time you start a game."
         with open(self.modelfilename, "w") as f:
-            f.write(str(self.w))
+            f.write(str(self.Q.to_dict()))
             "YOUR CODE HERE (OPTIONAL)"
 
     def initialize(self):
@@ -388,8 +538,9 @@ class ApproximateQLearningAgent(LearningAgent):
         "PLACE ANY INITIALIZATION CODE THAT YOU NEED HERE"
         "And you probably wanna initialize the data structure storing weights here."
         "You can use self.game.features() to get all the feature names."
+        import LinearQ # needs NumPy, so only loaded by the learning agents
         self.name = self.game.features()
-        self.w = {self.name[0] : 0, self.name[1] : 0, self.name[2] : 0, self.name[3]: 0}
+        self.Q = LinearQ.LinearQFunction(self.name) # weights indexed by self.name
 
     def get_Qvalue(self, state, action):
         "Evaluate the value of a Qstate Q(@state, @action)."
@@ -398,11 +549,14 @@ class ApproximateQLearningAgent(LearningAgent):
         Inner product of weights and features is the desired Qvalue.
         """
         "YOUR CODE HERE"
-        Qvalue = 0
         f = self.game.features(state, self.possible_moves[action])
-        for k in f.keys():
-            Qvalue = Qvalue + self.w[k]*f[k]
-        return Qvalue
+        return self.Q.value(self.Q.vector(f))
+
+    def get_Qvalues(self, state):
+        "Return [(a, Q(@state, a))] for every valid action a of @state."
+        "All the Q-values are the product of one features matrix from self.game.features_all_actions and the weights."
+        actions, F = self.game.features_all_actions(state, self.Q.index)
+        return list(zip(actions, self.Q.values(F).tolist()))
 
     def get_value(self, state):
         "Evaluate the value of a @state."
@@ -410,16 +564,8 @@ class ApproximateQLearningAgent(LearningAgent):
         Max(a)[Q(s, a)]
         """
         "YOUR CODE HERE"
-        n = 0
-        for a in self.valid_moves(state["pacman_pos"], self.game.valid):
-            Q = self.get_Qvalue(state, a)
-            if n == 0:
-                maxQ = Q
-                n = n + 1
-            elif Q >= maxQ:
-                maxQ = Q
-        value = maxQ
-        return value
+        _, F = self.game.features_all_actions(state, self.Q.index)
+        return float(self.Q.values(F).max())
 
     def updateWeights(self, diff, features):
         "Update the weights with given @diff and @features"
@@ -427,8 +573,14 @@ class ApproximateQLearningAgent(LearningAgent):
         new_W <- old_W + gamma x diff x features (NOTE: new_W, old_W, and features are vectors)
         """
         "YOUR CODE HERE"
-        for k in features.keys():
-            self.w[k] = self.w[k] + self.alpha * diff * features[k]
+        self.Q.update(self.alpha * diff, self.Q.vector(features))
+
+    def observe(self, s, action, ns):
+        "Update the weights from the transition of state @s with @action to state @ns."
+        R = ns["score"] - s["score"]
+        diff = (R + self.gamma*self.get_value(ns)) - self.get_Qvalue(s, action)
+        fea = self.game.features(s, self.possible_moves[action])
+        self.updateWeights(diff,fea)
 
     def learn(self):
         "Learn the weights by actually playing the game."
@@ -447,22 +599,84 @@ class ApproximateQLearningAgent(LearningAgent):
         "YOUR CODE HERE"
         for i in range(self.num_episodes):
             while self.game.end_game() == 0:
-                s = deepcopy(self.game.state)
+                s = self.game.copy_state(self.game.state)
                 a = self.best_of_state(s)
                 ran = uniform(0,1)
                 if ran < self.epsilon:
-                    vms = self.valid_moves(s["pacman_pos"], self.game.valid)
+                    vms = self.state_moves(s)
                     action = choice(vms)
                 else:
                     action = a
                 Qstate = self.game.nextstate("sim_pac", self.possible_moves[action])
                 ns = self.game.nextstate("sim_ghost_best_Q")
-                R = ns["score"] - s["score"]
-                diff = (R + self.gamma*self.get_value(ns)) - self.get_Qvalue(s, action)
-                fea = self.game.features(s, self.possible_moves[action])
-                self.updateWeights(diff,fea)
+                self.observe(s, action, ns)
             if (i%100==0):
-                print(self.w)
+                print(self.Q.to_dict())
             self.game.initialize()
         print("ok")
+        print("feature cache: %d hits, %d misses" % (self.game.feature_hits, self.game.feature_misses))
+        self.save() # save the resulted weights into a file (optional)
+
+class ReplayQLearningAgent(ApproximateQLearningAgent):
+    """
+    Approximate Q-learning agent that keeps its transitions in a replay buffer and learns from random minibatches of them,
+    so every simulated step is learned from many times instead of once.
+    """
+    CAPACITY = 10000 # most transitions kept, the oldest are overwritten
+    BATCH_SIZE = 32 # transitions per weight update
+
+    def initialize(self):
+        "Initialize this agent."
+        super().initialize()
+        import LinearQ
+        self.modelfilename = "Q3replay.txt" # learns with other updates than ApproximateQLearningAgent
+        self.replay = LinearQ.ReplayBuffer(self.CAPACITY, len(self.name), len(LEARNING_MOVES) - 1)
+
+    def remember(self, s, action, ns):
+        "Store the transition of state @s with @action to state @ns in the replay buffer."
+        f = self.Q.vector(self.game.features(s, self.possible_moves[action]))
+        _, F = self.game.features_all_actions(ns, self.Q.index)
+        self.replay.add(f, ns["score"] - s["score"], F)
+
+    def observe(self, s, action, ns):
+        "Store the transition of state @s with @action to state @ns, then update the weights with a minibatch of the stored transitions."
+        self.remember(s, action, ns)
+        if len(self.replay) >= self.BATCH_SIZE:
+            self.Q.td_update(self.alpha, self.gamma, *self.replay.sample(self.BATCH_SIZE))
+
+class LSPIAgent(ReplayQLearningAgent):
+    """
+    Linear Q agent that computes its weights by least-squares policy iteration instead of gradient steps.
+    It plays self.num_episodes games with random actions once, then alternates LSTD-Q evaluation of the greedy policy
+    on those transitions (a closed form solution for the weights) and policy improvement until the weights settle.
+    """
+    CAPACITY = 100000
+    MAX_ITERATIONS = 20
+    TOLERANCE = 1e-6 # largest weight change of a converged iteration
+
+    def initialize(self):
+        "Initialize this agent."
+        super().initialize()
+        self.modelfilename = "Q3lspi.txt"
+
+    def learn(self):
+        "Collect the transitions, then learn the weights by policy iteration on them."
+        for i in range(self.num_episodes):
+            while self.game.end_game() == 0:
+                s = self.game.copy_state(self.game.state)
+                action = choice(self.state_moves(s))
+                self.game.nextstate("sim_pac", self.possible_moves[action])
+                ns = self.game.nextstate("sim_ghost_best_Q")
+                self.remember(s, action, ns)
+            self.game.initialize()
+        print("%d transitions" % len(self.replay))
+        samples = self.replay.all()
+        i = 1
+        change = self.Q.lstdq(self.gamma, *samples)
+        print(i," ",change)
+        while change > self.TOLERANCE and i < self.MAX_ITERATIONS:
+            i = i + 1
+            change = self.Q.lstdq(self.gamma, *samples)
+            print(i," ",change)
+        print(self.Q.to_dict())
         self.save() # save the resulted weights into a file (optional)
@@ -1,30 +1,51 @@
 from Game import Game
-from freegames import floor, vector
+from freegames import vector
 import IntelligentAgents as Agents
-from copy import deepcopy
-from utils import PriorityQueue
-from collections import deque
-import math
+from collections import OrderedDict
 
 class LearningGame(Game):
     """
     Specialized Game class for reinforcement learning.
     """
+    tile_positions = True # the agents move one tile at a time
+    FEATURE_CACHE_SIZE = 4096 # most Q-states whose features are kept by self.features
+    FOOD_FIELD_CACHE_SIZE = 64 # most food distance fields kept by self.food_field
+
+    def __init__(self, *args, **kwargs):
+        self.feature_cache = OrderedDict() # {(self.state_key(state), action): features}, least recently used first
+        self.food_fields = OrderedDict() # {food bits: distance field to the closest food}, least recently used first
+        self.feature_hits = 0
+        self.feature_misses = 0
+        super().__init__(*args, **kwargs)
+
     def init_agents(self, pacmanAgent = "key", challenge = False):
         "Initialize agents with respect to the given type (@pacmanAgent)."
-        self.ghosts = [Agents.VIRandomGhostAgent(0, self.state['ghost%d_pos' % (i + 1)]) for i in range(1)]
+        self.ghosts = [Agents.VIRandomGhostAgent(0, self.point(self.state['ghost%d_pos' % (i + 1)])) for i in range(1)]
+        for g in self.ghosts:
+            g.maze = self.maze
         if pacmanAgent == "key":
-            self.pacman = Agents.KeyboardAgent(self.state['pacman_pos'])
+            self.pacman = Agents.KeyboardAgent(self.point(self.state['pacman_pos']))
             self.pacman.change_speed(2)
         elif pacmanAgent == "rein":
-            self.pacman = Agents.ApproximateQLearningAgent(1000, 0.1, 0.7, self, 0.5, self.state['pacman_pos'])
+            self.pacman = Agents.ApproximateQLearningAgent(1000, 0.1, 0.7, self, 0.5, self.point(self.state['pacman_pos']))
+        elif pacmanAgent == "replayrein":
+            self.pacman = Agents.ReplayQLearningAgent(1000, 0.1, 0.7, self, 0.5, self.point(self.state['pacman_pos']))
+        elif pacmanAgent == "lspi":
+            self.pacman = Agents.LSPIAgent(100, 0.1, 0.7, self, 0.5, self.point(self.state['pacman_pos']))
+        elif pacmanAgent == "parallelrein":
+            import ParallelLearning
+            self.pacman = ParallelLearning.ParallelQLearningAgent(1000, 0.1, 0.7, self, 0.5, self.point(self.state['pacman_pos']))
+        elif pacmanAgent == "batchrein":
+            import BatchLearning # needs NumPy, so only loaded when asked for
+            self.pacman = BatchLearning.BatchQLearningAgent(1000, 0.1, 0.7, self, 0.5, self.point(self.state['pacman_pos']))
         else:
             print("invalid agent name, use default agent instead (keyboard)")
-            self.pacman = Agents.KeyboardAgent(self.state['pacman_pos'])
+            self.pacman = Agents.KeyboardAgent(self.point(self.state['pacman_pos']))
             self.pacman.change_speed(2)
         if challenge:
-            self.ghosts = [Agents.AstarGhostAgent(0, self.state['ghost%d_pos' % (i + 1)]) for i in range(1)]
+            self.ghosts = [Agents.AstarGhostAgent(0, self.point(self.state['ghost%d_pos' % (i + 1)])) for i in range(1)]
             self.ghosts[0].change_speed(4)
+            self.ghosts[0].maze = self.maze
 
     def initialize(self):
         "Initialize game state."
@@ -51,125 +72,168 @@ class LearningGame(Game):
             0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0
         ]
         self.total_food = self.tiles.count(1)
-        self.state = {'score': 0, 'pacman_pos': vector(-40, -80),
-                            'ghost1_pos': vector(-180, 160),
-                            'food_num': self.tiles.count(1),
-                            'tiles': self.tiles}
-
-    def move(self):
-        "Move pacman and all ghosts, 0.1 discount from the score for every time unit passed."
-        super().move()
-        self.state['score'] = round(self.state['score'] - 0.1, 1)
+        self.state = {'score': 0, 'pacman_pos': self.position(vector(-40, -80)),
+                            'ghost1_pos': self.position(vector(-180, 160)),
+                            'food_bits': sum(1 << i for i, tile in enumerate(self.tiles) if tile == 1)} # bit i set if tiles[i] has food, self.tiles stays the layout
 
     def nextstate(self, agent, param1 = None, param2 = None):
         "Return the updated state for the given @agent and action(@param1, @param2)."
         if agent == "sim_ghost_best_Q": # ghost take the best action from the given Q-state (current state)
             state = self.state
-            end = self.end_game()
-            if end == 0:
-                for i in range(len(self.ghosts)):
-                    ghost = self.ghosts[i]
-                    temp = ghost.position
-                    ghost.position = state['ghost%d_pos' % (i + 1)]
-                    aim = self.ghosts[i].will_move(self.valid, self.state)
-                    ghost.position = temp
-                    state['ghost%d_pos' % (i + 1)] = state['ghost%d_pos' % (i + 1)] + aim
-                end = self.end_game()
-                if end == 0:
-                    state['score'] = round(state['score'] - 0.1, 1)
-                elif end == 1:
-                    state['score'] -= 200
+            if self.end_game() == 0:
+                self.ghosts_apply(state, [self.delta(aim) for aim in self.ghosts_will_move(state)])
             return state
 
         if agent == "sim_pac": # move the pacman due to given action (@param1) from the given state (@param2) or current state if @param2 is not given
-            state = self.state if param2 is None else deepcopy(param2)
-            tiles = state['tiles']
-            aim = param1
-            state["pacman_pos"] = state["pacman_pos"] + aim
-            index = self.offset(state["pacman_pos"])
-
-            if tiles[index] == 1:
-                tiles[index] = 2
-                state['score'] += 1
-                state['food_num'] -= 1
-
-            end = self.end_game()
-            if end == 2:
-                state['score'] += 100
-            elif end == 1:
-                state['score'] -= 200
+            state = self.state if param2 is None else self.copy_state(param2)
+            self.pacman_apply(state, self.delta(param1))
             return state
 
         return super().nextstate(agent, param1, param2)
 
-    def valid_moves(self, pos, possible_moves = Agents.LEARNING_MOVES):
-        "Return the move vectors (from @possible_moves) which are valid in the tiles at @pos."
-        return [n for n, m in possible_moves.items() if self.valid(pos + m) and n != "stop"]
-
-    def Astar_distance(self, chaser_pos, chasee_pos):
-        "Calculate the distance between @chaser_pos and @chasee_pos with A* search algorithm."
-        pq = PriorityQueue()
-        chaser_pos = chaser_pos.copy()
-        fringe = set()
-        fringe.add(chaser_pos)
-        i = 0
-        pq.push((0 + Agents.distance(chaser_pos, chasee_pos), 0, i, chaser_pos))
-        while True:
-            try:
-                _, cost, _, cnt_pos = pq.pop()
-                if Agents.distance(cnt_pos, chasee_pos) < 20:
-                    return cost
-                for n in self.valid_moves(cnt_pos):
-                    if (cnt_pos + Agents.LEARNING_MOVES[n]) in fringe:
-                        continue
-                    nxt_pos = cnt_pos + Agents.LEARNING_MOVES[n]
-                    fringe.add(nxt_pos)
-                    i += 1
-                    pq.push((cost + 1 + Agents.distance(nxt_pos, chasee_pos), cost + 1, i, nxt_pos))
-            except IndexError:
-                break
-        return float('inf') # theoretically, it won't reach here
-
-    def BFS(self, chaser_pos, tiles):
-        "Calculate the distance between @chaser_pos and closest food from it in the @tiles with BFS algorithm."
-        q = deque()
-        chaser_pos = chaser_pos.copy()
-        fringe = set()
-        fringe.add(chaser_pos)
-        q.append((0, chaser_pos))
-        while True:
-            try:
-                cost, cnt_pos = q.popleft()
-                if tiles[self.offset(cnt_pos)] == 1:
-                    return cost
-                for n in self.valid_moves(cnt_pos):
-                    if (cnt_pos + Agents.LEARNING_MOVES[n]) in fringe:
-                        continue
-                    nxt_pos = cnt_pos + Agents.LEARNING_MOVES[n]
-                    fringe.add(nxt_pos)
-                    q.append((cost + 1, nxt_pos))
-            except IndexError:
-                break
-        return 0
+    def copy_state(self, state):
+        "Return a copy of @state which self.pacman_apply and self.ghosts_apply can change without touching @state."
+        "Every value of a state is an int (the food is one integer), so a shallow copy is enough."
+        return dict(state)
+
+    def has_food(self, state, index):
+        "Return whether tile @index of @state has food."
+        return state['food_bits'] >> index & 1 == 1
+
+    def food_left(self, state):
+        "Return the number of food left in @state."
+        return bin(state['food_bits']).count("1")
+
+    def eat(self, state, index):
+        "Eat the food on tile @index of @state in place, if there is any."
+        "@Return: whether there was food."
+        if not self.has_food(state, index):
+            return False
+        state['food_bits'] &= ~(1 << index)
+        state['score'] += 1
+        return True
+
+    def uneat(self, state, index):
+        "Put the food eaten on tile @index back into @state. (the score is restored by self.undo)"
+        state['food_bits'] |= 1 << index
+
+    def ghosts_score(self, state, end):
+        "Update the score of @state in place after the ghosts moved, 0.1 discount from the score for every time unit passed."
+        if end == 0:
+            state['score'] = round(state['score'] - 0.1, 1)
+        elif end == 1:
+            state['score'] -= 200
+
+    def closest_food(self, state, pos):
+        "Return the maze distance from tile @pos to the closest food in @state, 0 if no food is left."
+        "It's looked up in the distance field of the food of @state. (see self.food_field)"
+        d = self.food_field(state["food_bits"])[pos]
+        return 0 if d == float('inf') else d
+
+    def food_field(self, food_bits):
+        "Return the maze distance from every tile to the closest food in @food_bits (see Maze.food_field). Don't modify the returned field."
+        """
+        Fields are cached by their food bits, so states never carry them and reading features doesn't change a state.
+        A field that differs by one food from the last one used is repaired from a copy of it instead of searched from scratch,
+        which is the common case of pacman eating his way through a game.
+        """
+        field = self.food_fields.get(food_bits)
+        if field is not None:
+            self.food_fields.move_to_end(food_bits)
+            return field
+        last = next(reversed(self.food_fields), None)
+        diff = food_bits ^ last if last is not None else 0
+        if diff != 0 and diff & (diff - 1) == 0: # exactly one food eaten or put back
+            field = self.food_fields[last][:]
+            if last & diff:
+                self.maze.remove_food(field, diff.bit_length() - 1)
+            else:
+                self.maze.add_food(field, diff.bit_length() - 1)
+        else:
+            field = self.maze.food_field(self.food_tiles(food_bits))
+        self.food_fields[food_bits] = field
+        if len(self.food_fields) > self.FOOD_FIELD_CACHE_SIZE:
+            self.food_fields.popitem(last = False)
+        return field
 
     def near_ghosts(self, cgds):
         "Calculate how many ghosts are in the neighborhood of pacman."
         return sum(cgd <= 2 for cgd in cgds)
 
+    def food_tiles(self, food_bits):
+        "Return the indices of the tiles with food in @food_bits."
+        return [idx for idx in self.maze.tiles if food_bits >> idx & 1]
+
+    def state_key(self, state):
+        "Return a small hashable key of everything the features of @state depend on."
+        return (state["pacman_pos"], state["food_bits"]) + tuple(state["ghost%d_pos" % (i + 1)] for i in range(len(self.ghosts)))
+
     def features(self, state = None, action = None):
         "Return feature names (if no arguments is given) or the features of the given Q-state (@state, @action)"
+        """
+        The features are memoized by (self.state_key(state), action), so the Q-states evaluated again within a learning step
+        (and the next state, which is the state of the next step) are not searched again. Don't modify the returned dictionary.
+        A state that changes gets another key, so stale features are never returned; the least recently used ones are dropped
+        beyond self.FEATURE_CACHE_SIZE. self.feature_hits and self.feature_misses count the lookups.
+        """
         if state is None:
             return ["bias", "closest_food_dist", "eats_food", "#_of_ghosts_near"]
-        else:
-            features = {}
-            cgds = [self.Astar_distance(state["pacman_pos"] + action, state["ghost%d_pos" % (i + 1)]) for i in range(len(self.ghosts))]
-            features["bias"] = 1.0
-            cfd = self.BFS(state["pacman_pos"] + action, state["tiles"])
-            features["closest_food_dist"] = cfd / len(self.tiles)
-            features["#_of_ghosts_near"] = self.near_ghosts(cgds) / len(self.ghosts)
-            if not self.near_ghosts(cgds) and state["tiles"][self.offset(state["pacman_pos"] + action)] == 1:
-                features["eats_food"] = 1.0
+        key = (self.state_key(state), action.x, action.y)
+        features = self.feature_cache.get(key)
+        if features is not None:
+            self.feature_hits += 1
+            self.feature_cache.move_to_end(key)
             return features
+        self.feature_misses += 1
+        features = self.compute_features(state, action)
+        self.feature_cache[key] = features
+        if len(self.feature_cache) > self.FEATURE_CACHE_SIZE:
+            self.feature_cache.popitem(last = False)
+        return features
+
+    def features_all_actions(self, state, index = None):
+        "Return (actions, F): the valid actions of pacman in @state and the NumPy features matrix F, F[i, index[name]] the feature name of taking actions[i]."
+        "@index maps every feature name to its column (LinearQFunction.index), the order of self.features() if None."
+        """
+        The whole matrix comes from one pass over pacman's neighbors in self.maze: the ghost distances are read from the maze's
+        BFS tables and the food distances from the distance field, so no search runs per action. Every feature then fills its
+        column in one assignment, so no dictionary is built per action.
+        """
+        import numpy as np # only the learning agents ask for feature matrices, so only loaded then
+        if index is None:
+            index = {k: i for i, k in enumerate(self.features())}
+        ghosts = [state["ghost%d_pos" % (i + 1)] for i in range(len(self.ghosts))]
+        field = self.food_field(state["food_bits"])
+        actions = []
+        cfds = []
+        nears = []
+        eats = []
+        for a, nxt in self.maze.neighbors[state["pacman_pos"]]:
+            near = self.near_ghosts([self.maze.distance(nxt, g) for g in ghosts])
+            actions.append(a)
+            cfds.append((0 if field[nxt] == float('inf') else field[nxt]) / len(self.tiles))
+            nears.append(near / len(self.ghosts))
+            eats.append(0.0 if near else float(self.has_food(state, nxt)))
+        F = np.zeros((len(index), len(actions))) # filled by columns of F, a row per feature here
+        F[index["bias"]] = 1.0
+        F[index["closest_food_dist"]] = cfds
+        F[index["eats_food"]] = eats
+        F[index["#_of_ghosts_near"]] = nears
+        return actions, F.T
+
+    def compute_features(self, state, action):
+        "Return the features of the Q-state (@state, @action) without looking them up in the cache."
+        "Positions are tiles, so the ghost distances are the maze distances of self.maze."
+        features = {}
+        pos = state["pacman_pos"] + self.delta(action)
+        cgds = [self.maze.distance(pos, state["ghost%d_pos" % (i + 1)]) for i in range(len(self.ghosts))]
+        features["bias"] = 1.0
+        cfd = self.closest_food(state, pos)
+        features["closest_food_dist"] = cfd / len(self.tiles)
+        features["#_of_ghosts_near"] = self.near_ghosts(cgds) / len(self.ghosts)
+        if not self.near_ghosts(cgds) and self.has_food(state, pos):
+            features["eats_food"] = 1.0
+        return features
 
     def end_game(self, state = None):
         """
@@ -178,16 +242,16 @@ class LearningGame(Game):
         """
         state = self.state if state is None else state
         for i in range(len(self.ghosts)):
-            if Agents.distance(state["pacman_pos"], state['ghost%d_pos' % (i + 1)]) < 20:
+            if self.collide(state["pacman_pos"], state['ghost%d_pos' % (i + 1)]):
                 return 1
-        if state["food_num"] == 0:
+        if state["food_bits"] == 0:
             return 2
         return 0
 
 def main():
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument("-p", "--pacmanAgent", help = "specify which agent to be used as the pacman agent (key/value/policy)")
+    parser.add_argument("-p", "--pacmanAgent", help = "specify which agent to be used as the pacman agent (key/rein/replayrein/lspi/parallelrein/batchrein)")
     parser.add_argument("-c", "--challenge", help = "whether to challenge a smarter ghost.", action = "store_true", default = False)
     args = parser.parse_args()
     g = LearningGame(False, args.pacmanAgent, args.challenge)
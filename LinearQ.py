@@ -0,0 +1,111 @@
+from random import getrandbits
+import numpy as np
+
+class LinearQFunction():
+    """
+    Linear Q-function Q(s, a) = w . f(s, a) of the learning agents.
+    The feature names fix the index of every feature, so the weights and the features are NumPy vectors,
+    the Q-values of a whole features matrix (rows of Q-states) are one product and an update is one vector operation.
+    Models are still saved as {feature name: weight} dictionaries.
+    """
+    def __init__(self, names):
+        self.names = list(names)
+        self.index = {k: i for i, k in enumerate(self.names)}
+        self.w = np.zeros(len(self.names))
+
+    def vector(self, features):
+        "Return the features dictionary {name: value} @features as a vector. (0 for the missing features)"
+        "Only for the dictionaries of LearningGame.features, features_all_actions fills the matrices of all actions by these indices directly."
+        f = np.zeros(len(self.names))
+        for k, v in features.items():
+            f[self.index[k]] = v
+        return f
+
+    def value(self, f):
+        "Return the Q-value of the features vector @f."
+        return float(f @ self.w)
+
+    def values(self, F):
+        "Return the Q-values of every row of the features matrix @F."
+        return np.asarray(F, dtype = float) @ self.w
+
+    def update(self, step, F):
+        "Add @step x @F to the weights: a vector @F with a number @step, or the rows of a matrix @F with a vector @step."
+        self.w += np.asarray(step) @ np.asarray(F, dtype = float) if np.ndim(F) == 2 else step * np.asarray(F, dtype = float)
+
+    def td_update(self, alpha, gamma, F, R, next_F, next_valid):
+        "Make one TD update from a minibatch of transitions (see ReplayBuffer.sample), with the mean of their updates."
+        "@Return: the TD errors R + gamma x Max(a')[Q(s', a')] - Q(s, a) of the transitions."
+        next_Q = np.where(next_valid, next_F @ self.w, -np.inf).max(axis = 1)
+        diff = R + gamma * next_Q - F @ self.w
+        self.update(alpha * diff / len(R), F)
+        return diff
+
+    def lstdq(self, gamma, F, R, next_F, next_valid, ridge = 1e-6):
+        "Set the weights to the LSTD-Q solution for the greedy policy of the current weights, from the transitions (see ReplayBuffer.sample)."
+        """
+        The policy picks a' = ArgMax(a')[Q(s', a')] (ties go to the last action like LearningAgent.best_of_state), and the new weights solve
+            Sigma[f(s, a) x (f(s, a) - gamma x f(s', a'))^T] w = Sigma[f(s, a) x R]
+        with @ridge added to the diagonal, since some feature may be constant on the transitions.
+        @Return: the largest change of a weight for convergence checking.
+        """
+        next_Q = np.where(next_valid, next_F @ self.w, -np.inf)
+        best = next_Q.shape[1] - 1 - next_Q[:, ::-1].argmax(axis = 1)
+        next_f = next_F[np.arange(len(R)), best]
+        A = F.T @ (F - gamma * next_f) + ridge * np.identity(len(self.w))
+        w = np.linalg.solve(A, F.T @ R)
+        change = float(np.abs(w - self.w).max())
+        self.w[:] = w
+        return change
+
+    def from_dict(self, weights):
+        "Set the weights from @weights, a dictionary of {feature name: weight} (the model text format)."
+        self.w[:] = 0
+        for k, v in weights.items():
+            self.w[self.index[k]] = v
+
+    def to_dict(self):
+        "Return the weights as a dictionary of {feature name: weight}."
+        return {k: float(v) for k, v in zip(self.names, self.w)}
+
+class ReplayBuffer():
+    """
+    Fixed-capacity ring buffer of transitions for learning from experience replay, stored in preallocated NumPy arrays:
+        F[i]: features of the Q-state (s, a)
+        R[i]: reward of the transition
+        next_F[i, j], next_valid[i, j]: features of the j-th valid action of the next state s', and which rows are used
+    Once full, every new transition overwrites the oldest one.
+    """
+    def __init__(self, capacity, num_features, max_actions, rng = None):
+        self.capacity = capacity
+        self.F = np.zeros((capacity, num_features))
+        self.R = np.zeros(capacity)
+        self.next_F = np.zeros((capacity, max_actions, num_features))
+        self.next_valid = np.zeros((capacity, max_actions), dtype = bool)
+        self.size = 0
+        self.next = 0 # slot of the next transition
+        self.rng = np.random.default_rng(getrandbits(32)) if rng is None else rng # seeded from random, so it follows Agents' seed
+
+    def __len__(self):
+        return self.size
+
+    def add(self, f, R, next_F):
+        "Store the transition with features @f and reward @R to a state whose actions have the features matrix @next_F."
+        i = self.next
+        self.F[i] = f
+        self.R[i] = R
+        self.next_F[i] = 0
+        self.next_F[i, :len(next_F)] = next_F
+        self.next_valid[i] = False
+        self.next_valid[i, :len(next_F)] = True
+        self.next = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def all(self):
+        "Return (F, R, next_F, next_valid) of all the stored transitions."
+        return self.F[:self.size], self.R[:self.size], self.next_F[:self.size], self.next_valid[:self.size]
+
+    def sample(self, n):
+        "Return (F, R, next_F, next_valid) of @n transitions picked uniformly at random."
+        idx = self.rng.integers(self.size, size = n)
+        return self.F[idx], self.R[idx], self.next_F[idx], self.next_valid[idx]
@@ -0,0 +1,147 @@
+from freegames import vector
+from collections import deque
+from array import array
+from heapq import heappush, heappop
+import Agents
+
+class MazeIndex():
+    """
+    All-pairs maze distances and chase actions over the walkable tiles of a game layout.
+    Built once per game (distances with BFS, chase actions with the A* search of Agents.Agent.best_chase), so chasing and distance queries become table lookups.
+    Distances are in tiles and actions are the names in Agents.LEARNING_MOVES (one tile per move).
+    Tiles are plain int indices into game.tiles, and self.points converts them to pixel vectors where those are needed.
+    """
+    def __init__(self, game):
+        self.game = game
+        self.size = len(game.tiles)
+        self.tiles = [idx for idx in range(self.size) if game.tiles[idx] > 0]
+        self.points = {idx: vector(*game.cord(idx)) for idx in self.tiles}
+        self.neighbors = {idx: self.tile_moves(idx) for idx in self.tiles}
+        self.moves = {idx: [n for n, _ in self.neighbors[idx]] for idx in self.tiles} # valid actions of every tile, in the order of Agent.valid_moves
+        self.dist = {}
+        self.first = {}
+        for dst in self.tiles:
+            self.dist[dst] = self.bfs(dst)
+        for dst in self.tiles:
+            self.first[dst] = self.chase_moves(dst)
+
+    def tile_moves(self, idx):
+        "Return [(action, neighbor tile)] of the valid one-tile moves from tile @idx."
+        pos = self.points[idx]
+        return [(n, self.game.offset(pos + m)) for n, m in Agents.LEARNING_MOVES.items() if n != "stop" and self.game.valid(pos + m)]
+
+    def bfs(self, dst):
+        "Return the maze distance from every reachable tile to tile @dst."
+        dist = {dst: 0}
+        q = deque([dst])
+        while q:
+            cnt = q.popleft()
+            for _, nxt in self.neighbors[cnt]:
+                if nxt not in dist:
+                    dist[nxt] = dist[cnt] + 1
+                    q.append(nxt)
+        return dist
+
+    def chase_moves(self, dst):
+        "Return {src: first action} of the chase from every walkable tile src to tile @dst. (see self.chase_first)"
+        target = self.points[dst]
+        h = {idx: Agents.distance(self.points[idx], target) for idx in self.tiles}
+        return {src: self.chase_first(src, dst, h) for src in self.tiles}
+
+    def chase_first(self, src, dst, h):
+        "Return the first action Agents.Agent.best_chase takes from tile @src to tile @dst, with @h the euclidean distances of the tiles to @dst."
+        """
+        This is the same A* search on tile indices: the heuristic is in pixels against a cost of 1 per tile, so the search is greedy
+        and the first action isn't always the one of a shortest path. Nodes are pushed and popped in the same order as in best_chase,
+        so it takes the same action. ('stop' if already there or unreachable)
+        """
+        heap = [(0 + h[src], 0, 0, src, "stop")]
+        fringe = {src}
+        i = 0
+        while heap:
+            _, cost, _, cnt, first = heappop(heap)
+            if cnt == dst: # tiles are 20 px apart, so this is best_chase's distance < 20
+                return first
+            for n, nxt in self.neighbors[cnt]:
+                if nxt in fringe:
+                    continue
+                fringe.add(nxt)
+                i += 1
+                heappush(heap, (cost + 1 + h[nxt], cost + 1, i, nxt, n if cnt == src else first))
+        return "stop"
+
+    def index(self, pos):
+        "Return the tile index of @pos, or None if @pos is not aligned to a walkable tile."
+        if pos.x % 20 != 0 or pos.y % 20 != 0:
+            return None
+        idx = self.game.offset(pos)
+        if idx not in self.neighbors:
+            return None
+        return idx
+
+    def distance(self, src, dst):
+        "Return the maze distance from tile @src to tile @dst. (inf if unreachable)"
+        return self.dist[dst].get(src, float('inf'))
+
+    def first_move(self, src, dst):
+        "Return the action Agents.Agent.best_chase takes from tile @src to tile @dst. ('stop' if already there or unreachable)"
+        return self.first[dst][src]
+
+    def food_field(self, foods):
+        "Return the maze distance from every tile to the closest of the tiles @foods (indices of the tiles with food), indexed like game.tiles. (inf if no food is reachable)"
+        field = array('d', [float('inf')]) * self.size
+        q = deque()
+        for idx in foods:
+            field[idx] = 0
+            q.append(idx)
+        while q:
+            cnt = q.popleft()
+            for _, nxt in self.neighbors[cnt]:
+                if field[nxt] == float('inf'):
+                    field[nxt] = field[cnt] + 1
+                    q.append(nxt)
+        return field
+
+    def add_food(self, field, idx):
+        "Update @field (see self.food_field) in place after food is put on tile @idx. (only the tiles now closer to @idx are visited)"
+        field[idx] = 0
+        q = deque([idx])
+        while q:
+            cnt = q.popleft()
+            for _, nxt in self.neighbors[cnt]:
+                if field[cnt] + 1 < field[nxt]:
+                    field[nxt] = field[cnt] + 1
+                    q.append(nxt)
+
+    def remove_food(self, field, eaten):
+        "Update @field (see self.food_field) in place after the food on tile @eaten is eaten."
+        """
+        Only the tiles whose closest food may have been @eaten change, and they form a connected region around @eaten.
+        The region is cleared and filled again from the distances on its border, so the rest of the maze is never visited.
+        """
+        dist = self.dist[eaten]
+        region = {eaten}
+        q = deque([eaten])
+        while q:
+            cnt = q.popleft()
+            for _, nxt in self.neighbors[cnt]:
+                if nxt not in region and field[nxt] == dist.get(nxt):
+                    region.add(nxt)
+                    q.append(nxt)
+        for idx in region:
+            field[idx] = float('inf')
+        heap = []
+        for idx in region:
+            for _, nxt in self.neighbors[idx]:
+                if nxt not in region and field[nxt] + 1 < field[idx]:
+                    field[idx] = field[nxt] + 1
+            if field[idx] < float('inf'):
+                heappush(heap, (field[idx], idx))
+        while heap:
+            d, cnt = heappop(heap)
+            if d > field[cnt]:
+                continue
+            for _, nxt in self.neighbors[cnt]:
+                if d + 1 < field[nxt]:
+                    field[nxt] = d + 1
+                    heappush(heap, (d + 1, nxt))
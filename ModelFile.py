@@ -0,0 +1,88 @@
+"""
+Binary model format of the MDP agents:
+    header: magic, version, byte order, gamma, number of states, maze fingerprint (see HEADER)
+    values: number of states x float64
+    policy: number of states x uint8 (indices into IntelligentAgents.ACTIONS)
+Values and policy are contiguous, so a model is loaded by memory mapping the file instead of parsing it.
+"""
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b"PACMDP"
+VERSION = 1
+HEADER = struct.Struct("<6sHcxdQ32s") # magic, version, byte order, padding, gamma, number of states, fingerprint
+DATA_OFFSET = 64 # values start 8-byte aligned after the header
+
+class ModelMismatch(ValueError):
+    """
+    Raised when a model file exists but was saved for another maze, gamma or format.
+    """
+    pass
+
+def save(filename, fingerprint, gamma, V, P):
+    "Save the values @V and policy @P (any buffers of float64 / uint8) planned with @gamma on the maze with @fingerprint."
+    n = len(V)
+    header = HEADER.pack(MAGIC, VERSION, sys.byteorder[0].encode(), gamma, n, fingerprint)
+    tmpname = filename + ".tmp"
+    with open(tmpname, "wb") as f:
+        f.write(header.ljust(DATA_OFFSET, b"\0"))
+        f.write(memoryview(V).cast("B"))
+        f.write(memoryview(P).cast("B"))
+    os.replace(tmpname, filename) # never leave a half-written model behind, another process may have it mapped
+
+def load(filename, fingerprint, gamma):
+    """
+    Memory map the model in @filename and return (values, policy) as memoryviews over the file.
+    The mapping is copy-on-write: pages are shared with other processes until a view is written.
+    Raise FileNotFoundError if there is no such file and ModelMismatch if it doesn't fit @fingerprint and @gamma.
+    """
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size < DATA_OFFSET: # also too short to map if empty
+            raise ModelMismatch("%s is not a model file" % filename)
+        mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_COPY)
+    magic, version, byteorder, file_gamma, n, file_fingerprint = HEADER.unpack_from(mm)
+    if magic != MAGIC or version != VERSION or byteorder != sys.byteorder[0].encode():
+        raise ModelMismatch("%s is not a version %d model file for this machine" % (filename, VERSION))
+    if file_fingerprint != fingerprint:
+        raise ModelMismatch("%s was saved for another maze" % filename)
+    if file_gamma != gamma:
+        raise ModelMismatch("%s was saved with gamma %g" % (filename, file_gamma))
+    if len(mm) != DATA_OFFSET + 9 * n:
+        raise ModelMismatch("%s is truncated" % filename)
+    data = memoryview(mm)
+    V = data[DATA_OFFSET: DATA_OFFSET + 8 * n].cast("d")
+    P = data[DATA_OFFSET + 8 * n:]
+    return V, P
+
+MAX_RESIDUAL = 0.01 # largest Bellman residual of a converted model, the convergence threshold of ValueIterationAgent.plan
+
+def main():
+    "Convert the text models (Q1.txt, Q2.txt) into binary models (Q1.mdp, Q2.mdp), overwriting them. Fails if a text model is missing."
+    """
+    The binary models are stamped with the current maze fingerprint, but nothing in a text model tells which ghost model it was planned with.
+    So a text model is only converted if its values are the values of the current one: their Bellman residual (see MDPAgent.bellman_residual)
+    must be at most MAX_RESIDUAL. Otherwise it's skipped and the binary model is planned again with the current ghost model,
+    unless --force is given, which converts it anyway with a warning.
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description = "Convert the text models Q1.txt and Q2.txt into the binary models Q1.mdp and Q2.mdp.")
+    parser.add_argument("-f", "--force", help = "also convert text models planned with another ghost model (Bellman residual above %g), instead of planning them again." % MAX_RESIDUAL, action = "store_true", default = False)
+    args = parser.parse_args()
+    from ValueIterGame import ValueIterGame
+    import IntelligentAgents as Agents
+    game = ValueIterGame(True, "key")
+    for cls in (Agents.ValueIterationAgent, Agents.PolicyIterationAgent):
+        agent = cls.from_text(game, 0.5)
+        residual = agent.bellman_residual()
+        if residual > MAX_RESIDUAL:
+            if not args.force:
+                print("skipped %s: its Bellman residual is %g, so it wasn't planned with the current ghost model; %s holds a plan of the current one instead" % (agent.textfilename, residual, agent.modelfilename))
+                continue
+            print("warning: %s has a Bellman residual of %g, so it wasn't planned with the current ghost model" % (agent.textfilename, residual))
+        agent.save()
+        print("saved %s from %s" % (agent.modelfilename, agent.textfilename))
+
+if __name__ == "__main__":
+    main()
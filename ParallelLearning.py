@@ -0,0 +1,96 @@
+from IntelligentAgents import * # extend IntelligentAgents module with the multi-process learner
+from concurrent.futures import ProcessPoolExecutor
+from random import getrandbits
+import random
+
+worker = {} # state of a worker process, set up by init_worker
+
+class RolloutAgent(ApproximateQLearningAgent):
+    """
+    Learning agent living in a worker process, only used to play games with the weights it's given.
+    """
+    def load(self):
+        "Nothing to load, every task brings its weights."
+        pass
+
+def init_worker(epsilon):
+    "Set up a worker process: build its own game and agent."
+    from LearningGame import LearningGame
+    game = LearningGame(True, "key")
+    worker["agent"] = RolloutAgent(0, 0, epsilon, game, 0, game.point(game.state["pacman_pos"]))
+
+def rollout(weights, episodes, task_seed):
+    "Play @episodes games epsilon-greedily with @weights, all random numbers (pacman's and the ghosts') seeded with @task_seed."
+    "@Return: the transitions as (F, R, next_F, next_valid), see LinearQ.ReplayBuffer."
+    random.seed(task_seed)
+    agent = worker["agent"]
+    game = agent.game
+    agent.Q.w[:] = weights
+    transitions = []
+    for i in range(episodes):
+        game.initialize()
+        while game.end_game() == 0:
+            s = game.copy_state(game.state)
+            action = agent.best_of_state(s)
+            if uniform(0, 1) < agent.epsilon:
+                action = choice(agent.state_moves(s))
+            game.nextstate("sim_pac", agent.possible_moves[action])
+            ns = game.nextstate("sim_ghost_best_Q")
+            transitions.append((agent.Q.vector(game.features(s, agent.possible_moves[action])), ns["score"] - s["score"], game.features_all_actions(ns, agent.Q.index)[1]))
+    import LinearQ
+    replay = LinearQ.ReplayBuffer(max(len(transitions), 1), len(agent.name), len(LEARNING_MOVES) - 1)
+    for f, R, next_F in transitions:
+        replay.add(f, R, next_F)
+    return replay.all()
+
+class ParallelQLearningAgent(ApproximateQLearningAgent):
+    """
+    Approximate Q-learning agent that plays its games in a pool of worker processes and learns from their transitions.
+    Every round, self.TASKS tasks of self.EPISODES games are played with a snapshot of the weights, and the learner makes
+    minibatch TD updates from the transitions of the previous round while they run, so the snapshots are one round old.
+    Tasks are seeded from one master seed and their transitions are learned in submission order,
+    so the weights only depend on the master seed, not on the number of processes or their timing.
+    """
+    TASKS = 8 # tasks per round, independent of the number of processes
+    EPISODES = 10 # games per task
+    BATCH_SIZE = 32 # transitions per weight update
+
+    def initialize(self):
+        "Initialize this agent."
+        super().initialize()
+        self.modelfilename = "Q3parallel.txt" # learns with other updates than ApproximateQLearningAgent
+        self.workers = None # number of worker processes, None for one per CPU
+        self.seed = getrandbits(32) # master seed, taken from random so it follows Agents' seed
+
+    def submit(self, pool, episodes, r):
+        "Submit the tasks of round @r, playing @episodes more games at most."
+        "@Return: (futures, number of games submitted)."
+        futures = []
+        n = 0
+        for k in range(self.TASKS):
+            m = min(self.EPISODES, episodes - n)
+            if m <= 0:
+                break
+            futures.append(pool.submit(rollout, self.Q.w.copy(), m, "%d:%d:%d" % (self.seed, r, k)))
+            n += m
+        return futures, n
+
+    def learn(self):
+        "Learn the weights from self.num_episodes games played by the worker processes."
+        done = 0
+        r = 0
+        pending = []
+        with ProcessPoolExecutor(self.workers, initializer = init_worker, initargs = (self.epsilon,)) as pool:
+            while done < self.num_episodes or pending:
+                futures, n = self.submit(pool, self.num_episodes - done, r)
+                done += n
+                r += 1
+                for future in pending:
+                    F, R, next_F, next_valid = future.result()
+                    for i in range(0, len(R), self.BATCH_SIZE):
+                        j = i + self.BATCH_SIZE
+                        self.Q.td_update(self.alpha, self.gamma, F[i:j], R[i:j], next_F[i:j], next_valid[i:j])
+                pending = futures
+                print(r, " ", done, " ", self.Q.to_dict())
+        print("ok")
+        self.save() # save the resulted weights into a file (optional)
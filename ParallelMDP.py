@@ -0,0 +1,197 @@
+from IntelligentAgents import * # extend IntelligentAgents module with the multi-process planner
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from contextlib import ExitStack
+import os
+
+worker = {} # state of a worker process, set up by init_worker
+
+class SweepWorker(MDPAgent):
+    """
+    MDP agent living in a worker process, only used to compute the transitions of its game.
+    """
+    def initialize(self):
+        "Initialize this agent."
+        self.states = list(self.game.allstates())
+        self.model = {} # {state index: self.state_model(state)}, compiled the first time a state is backed up
+
+    def load(self):
+        "Nothing to load, the planning happens in the parent process."
+        pass
+
+def init_worker(game_options, gamma, names):
+    "Set up a worker process: build its own game and agent, and attach the shared value and policy buffers."
+    from ValueIterGame import ValueIterGame
+    game = ValueIterGame(True, **game_options)
+    worker["agent"] = SweepWorker(game, gamma, game.point(game.state["pacman_pos"]))
+    worker["shm"] = [SharedMemory(name = name) for name in names]
+    worker["values"] = [shm.buf.cast("d") for shm in worker["shm"][:2]]
+    worker["policy"] = worker["shm"][2].buf
+
+def compiled(agent, i):
+    "Return the end value or the transitions of state @i of the worker @agent, compiled the first time it's asked for."
+    if i not in agent.model:
+        agent.model[i] = agent.state_model(agent.states[i])
+    return agent.model[i]
+
+def sweep(states, src):
+    "Back up @states from the values in buffer @src into the other buffer, like ValueIterationAgent.iteration does."
+    "@Return: total difference of the state values of @states."
+    agent = worker["agent"]
+    old_V, new_V = worker["values"][src], worker["values"][1 - src]
+    P = worker["policy"]
+    delta = 0
+    for i in states:
+        model = compiled(agent, i)
+        if not isinstance(model, list):
+            delta = delta + abs(model - old_V[i])
+            new_V[i] = model
+            continue
+        V = 0
+        action = "stop"
+        for n, (a, outcomes) in enumerate(model):
+            V_new = 0
+            for prob, j, R in outcomes:
+                V_new = V_new + prob*(R + agent.gamma*old_V[j])
+            if n == 0 or V_new >= V:
+                V = V_new
+                action = a
+        delta = delta + abs(V - old_V[i])
+        new_V[i] = V
+        P[i] = ACTIONS.index(action)
+    return delta
+
+def evaluate(states, src):
+    "Evaluate the policy on @states from the values in buffer @src into the other buffer, like PolicyIterationAgent.policyevaluation does."
+    "@Return: 0, so the results of the workers can be summed like the others."
+    agent = worker["agent"]
+    old_V, new_V = worker["values"][src], worker["values"][1 - src]
+    P = worker["policy"]
+    for i in states:
+        model = compiled(agent, i)
+        if not isinstance(model, list):
+            new_V[i] = model
+            continue
+        a = ACTIONS[P[i]]
+        outcomes = model[0][1] # the first valid action if the policy action is invalid
+        for b, b_outcomes in model:
+            if b == a:
+                outcomes = b_outcomes
+                break
+        V = 0
+        for prob, j, R in outcomes:
+            V = V + prob*(R + agent.gamma*old_V[j])
+        new_V[i] = V
+    return 0
+
+def extract(states, src):
+    "Extract the policy on @states from the values in buffer @src, like PolicyIterationAgent.policyextraction does."
+    "@Return: the number of states of @states whose policy didn't change. (end states count as unchanged)"
+    agent = worker["agent"]
+    V_src = worker["values"][src]
+    P = worker["policy"]
+    same = 0
+    for i in states:
+        model = compiled(agent, i)
+        if not isinstance(model, list):
+            same = same + 1
+            continue
+        V = 0
+        action = "stop"
+        for n, (a, outcomes) in enumerate(model):
+            V_new = 0
+            for prob, j, R in outcomes:
+                V_new = V_new + prob*(R + agent.gamma*V_src[j])
+            if n == 0 or V_new >= V:
+                V = V_new
+                action = a
+        if P[i] == ACTIONS.index(action):
+            same = same + 1
+        else:
+            P[i] = ACTIONS.index(action)
+    return same
+
+class ParallelPlanner():
+    """
+    Base of the MDP agents that run their sweeps in a pool of worker processes, listed before the planning agent class in the bases.
+    The states are partitioned by pacman tile, workers read the previous values from and write the new values to shared memory,
+    and the partitions are merged by swapping the two value buffers between sweeps.
+    Every worker is a pool of one process that owns a fixed share of the partitions for the whole plan,
+    so the transitions of every state are compiled once, by the worker that owns it.
+    """
+    def initialize(self):
+        "Initialize this agent."
+        super().initialize()
+        self.workers = None # number of worker processes, None for one per CPU
+
+    def plan(self):
+        "Start the worker processes, then construct the policy with parallel sweeps."
+        partitions = {}
+        for i, s in enumerate(self.game.allstates()):
+            partitions.setdefault(s["pacman_pos"], []).append(i)
+        self.partitions = list(partitions.values())
+        n = self.game.num_states()
+        self.shm = [SharedMemory(create = True, size = 8 * n) for _ in range(2)] + [SharedMemory(create = True, size = n)]
+        try:
+            self.values = [shm.buf.cast("d") for shm in self.shm[:2]]
+            self.values[0][:] = memoryview(self.V)
+            self.shm[2].buf[:] = memoryview(self.P)
+            self.src = 0
+            game_options = {"reachable": self.game.reachable, "symmetric": self.game.symmetric}
+            names = [shm.name for shm in self.shm]
+            workers = min(self.workers or os.cpu_count() or 1, len(self.partitions))
+            self.shares = [sum(self.partitions[w::workers], []) for w in range(workers)] # states of every worker
+            with ExitStack() as stack:
+                self.pools = [stack.enter_context(ProcessPoolExecutor(1, initializer = init_worker, initargs = (game_options, self.gamma, names))) for _ in range(workers)]
+                super().plan()
+        finally:
+            for view in self.values:
+                view.release()
+            for shm in self.shm:
+                shm.close()
+                shm.unlink()
+
+    def run(self, task):
+        "Run @task(states, buffer with the current values) on the share of every worker, one task per worker."
+        "@Return: the sum of the results of the shares."
+        futures = [pool.submit(task, states, self.src) for pool, states in zip(self.pools, self.shares)]
+        return sum(f.result() for f in futures)
+
+    def swap(self):
+        "Make the values written by the last sweep the current ones, and copy them and the policy into self.V and self.P."
+        self.src = 1 - self.src
+        memoryview(self.V)[:] = self.values[self.src]
+        memoryview(self.P)[:] = self.shm[2].buf
+
+class ParallelValueIterationAgent(ParallelPlanner, ValueIterationAgent):
+    """
+    Value iteration agent that runs every sweep in a pool of worker processes.
+    Every state is backed up exactly like in ValueIterationAgent, so the values and policy are the same and it shares its model file.
+    """
+    def iteration(self):
+        "Update the state values and policy with one step look ahead, one task per worker."
+        "@Return: total difference of the state values for convergence checking."
+        delta = self.run(sweep)
+        self.swap()
+        return delta
+
+class ParallelPolicyIterationAgent(ParallelPlanner, PolicyIterationAgent):
+    """
+    Policy iteration agent that runs the policy evaluation and extraction sweeps in a pool of worker processes.
+    Every state is evaluated and extracted exactly like in PolicyIterationAgent, so the values and policy are the same and it shares its model file.
+    """
+    def policyevaluation(self):
+        "Evaluate the state value due to the current policy, one task per worker."
+        self.run(evaluate)
+        self.swap()
+
+    def policyextraction(self):
+        "Extract the policy from the updated state values, one task per worker."
+        "@Return: whether the policy's the same as the last one for convergence checking."
+        temp = self.run(extract)
+        memoryview(self.P)[:] = self.shm[2].buf
+        print(temp)
+        if temp == self.game.num_states():
+            print(temp)
+            return True
+        return False
@@ -0,0 +1,157 @@
+from IntelligentAgents import * # extend IntelligentAgents module with the NumPy solvers
+import numpy as np
+try:
+    from scipy import sparse
+    from scipy.sparse.linalg import spsolve
+except ImportError: # SparsePolicyIterationAgent falls back to NumPy
+    sparse = None
+
+class SparseMDP():
+    """
+    The MDP of a ValueIterGame compiled once into flat NumPy arrays.
+    Every (state, action) pair of a non-terminal state is a row, and every possible next state of a row is an entry:
+        entry_pair[k], entry_next[k], entry_prob[k], entry_reward[k] = row, s', T(s, a, s'), R(s, a, s')
+    so a Bellman backup is one gather, one multiply and one bincount over the entries.
+    """
+    def __init__(self, agent):
+        game = agent.game
+        self.num_states = game.num_states()
+        self.terminal = np.zeros(self.num_states, dtype=bool)
+        self.terminal_value = np.zeros(self.num_states)
+        pair_state, pair_action = [], []
+        entry_pair, entry_next, entry_prob, entry_reward = [], [], [], []
+        for i, s in enumerate(game.allstates()):
+            end = game.end_game(s)
+            if end != 0:
+                self.terminal[i] = True
+                self.terminal_value[i] = -200 if end == 1 else 100
+                continue
+            for a, outcomes in agent.transitions(s):
+                row = len(pair_state)
+                pair_state.append(i)
+                pair_action.append(ACTIONS.index(a))
+                for prob, j, R in outcomes:
+                    entry_pair.append(row)
+                    entry_next.append(j)
+                    entry_prob.append(prob)
+                    entry_reward.append(R)
+        self.pair_state = np.array(pair_state, dtype=np.intp)
+        self.pair_action = np.array(pair_action, dtype=np.intp)
+        self.entry_pair = np.array(entry_pair, dtype=np.intp)
+        self.entry_next = np.array(entry_next, dtype=np.intp)
+        self.entry_prob = np.array(entry_prob, dtype=float)
+        self.entry_reward = np.array(entry_reward, dtype=float)
+        self.live = np.flatnonzero(~self.terminal)
+
+    def qvalues(self, V, gamma):
+        "Return Q(s, a) of every row given the state values @V."
+        "Entries are summed in the same order as the Python planners, so the results are bitwise identical."
+        w = self.entry_prob * (self.entry_reward + gamma * V[self.entry_next])
+        return np.bincount(self.entry_pair, weights = w, minlength = len(self.pair_state))
+
+    def qtable(self, V, gamma):
+        "Return Q(s, a) as a (states x ACTIONS) table, -inf for invalid actions and terminal states."
+        Q = np.full((self.num_states, len(ACTIONS)), -np.inf)
+        Q[self.pair_state, self.pair_action] = self.qvalues(V, gamma)
+        return Q
+
+    def backup(self, V, gamma):
+        """
+        Return (new_V, best action index) of every state with one step look ahead from @V.
+        Like the Python planners, ties go to the action that comes last in ACTIONS, and terminal states keep their end value.
+        """
+        Q = self.qtable(V, gamma)[:, ::-1]
+        best = len(ACTIONS) - 1 - Q.argmax(axis = 1)
+        new_V = np.where(self.terminal, self.terminal_value, Q.max(axis = 1))
+        return new_V, best
+
+class SparseValueIterationAgent(ValueIterationAgent):
+    """
+    Value iteration agent that compiles the MDP into a SparseMDP once and runs every sweep vectorized.
+    It computes the same values and policy as ValueIterationAgent and shares its model file.
+    """
+    def plan(self):
+        "Compile the MDP, then construct the policy with vectorized sweeps."
+        self.model = SparseMDP(self)
+        super().plan()
+
+    def iteration(self):
+        "Update the state values and policy with one vectorized step look ahead."
+        "@Return: total difference of the state values for convergence checking."
+        V = np.frombuffer(self.V)
+        P = np.frombuffer(self.P, dtype = np.uint8)
+        new_V, best = self.model.backup(V, self.gamma)
+        delta = np.abs(new_V - V).sum()
+        V[:] = new_V
+        P[self.model.live] = best[self.model.live]
+        return delta
+
+class SparsePolicyIterationAgent(PolicyIterationAgent):
+    """
+    Policy iteration agent that evaluates every policy exactly by solving (I - gamma x P_pi) V = R_pi.
+    The linear system is solved with SciPy's sparse direct solver when SciPy is installed;
+    otherwise small mazes use a dense NumPy solve and larger ones iterate the vectorized evaluation to machine precision.
+    """
+    DENSE_LIMIT = 2000 # largest number of states solved densely without SciPy
+    TOLERANCE = 1e-9 # smallest Q-value improvement that changes the policy
+
+    def initialize(self):
+        "Initialize this agent."
+        super().initialize()
+        self.modelfilename = "Q2exact.mdp" # exact evaluation converges to a different policy than PolicyIterationAgent
+        self.textfilename = None
+
+    def plan(self):
+        "Compile the MDP, then construct the policy with exact evaluations."
+        self.model = SparseMDP(self)
+        m = self.model
+        self.row_of = np.full((m.num_states, len(ACTIONS)), -1, dtype = np.intp)
+        self.row_of[m.pair_state, m.pair_action] = np.arange(len(m.pair_state))
+        self.first_row = np.searchsorted(m.pair_state, m.live) # rows of a state follow the valid_moves order
+        super().plan()
+
+    def policy_rows(self):
+        "Return the row of the policy action of every non-terminal state, the first valid action if the policy action is invalid."
+        P = np.frombuffer(self.P, dtype = np.uint8)
+        rows = self.row_of[self.model.live, P[self.model.live]]
+        return np.where(rows < 0, self.first_row, rows)
+
+    def policyevaluation(self):
+        "Evaluate the state values due to the current policy exactly."
+        m = self.model
+        selected = np.zeros(len(m.pair_state), dtype = bool)
+        selected[self.policy_rows()] = True
+        k = selected[m.entry_pair]
+        rows = m.pair_state[m.entry_pair[k]]
+        cols = m.entry_next[k]
+        probs = m.entry_prob[k]
+        R = m.terminal_value + np.bincount(rows, weights = probs * m.entry_reward[k], minlength = m.num_states)
+        V = np.frombuffer(self.V)
+        if sparse is not None:
+            A = sparse.identity(m.num_states, format = "csr") - self.gamma * sparse.csr_matrix((probs, (rows, cols)), shape = (m.num_states, m.num_states))
+            V[:] = spsolve(A.tocsc(), R)
+        elif m.num_states <= self.DENSE_LIMIT:
+            A = np.identity(m.num_states)
+            np.add.at(A, (rows, cols), -self.gamma * probs)
+            V[:] = np.linalg.solve(A, R)
+        else:
+            while True:
+                new_V = R + self.gamma * np.bincount(rows, weights = probs * V[cols], minlength = m.num_states)
+                delta = np.abs(new_V - V).max()
+                V[:] = new_V
+                if delta < 1e-12:
+                    break
+
+    def policyextraction(self):
+        "Extract the greedy policy from the evaluated state values."
+        "A state only switches action if that is better by more than self.TOLERANCE, so rounding in the solver can't make the policy flip between tied actions forever."
+        "@Return: whether the policy stayed the same for convergence checking."
+        m = self.model
+        P = np.frombuffer(self.P, dtype = np.uint8)
+        V = np.frombuffer(self.V)
+        rows = self.policy_rows()
+        current = m.qvalues(V, self.gamma)[rows]
+        best_V, best = m.backup(V, self.gamma)
+        improve = best_V[m.live] > current + self.TOLERANCE
+        P[m.live] = np.where(improve, best[m.live], m.pair_action[rows])
+        return not improve.any()
@@ -1,30 +1,63 @@
 from Game import Game
-from freegames import floor, vector
+from freegames import vector
 import IntelligentAgents as Agents
-from copy import deepcopy
+from collections import deque
+import hashlib
+import os
 
 class ValueIterGame(Game):
     """
     Specialized Game class for MDP value iteration and policy iteration.
     """
+    tile_positions = True # the agents move one tile at a time
+    def __init__(self, *args, reachable = False, symmetric = False, **kwargs):
+        self.ghost_model = {} # {(ghost tile, pacman tile): [(ghost action, probability)]}, filled by the MDP agents
+        self.reachable = reachable # plan only on the states reachable from the initial state
+        self.symmetric = symmetric # plan only on one state of every set of mirrored states
+        self.space_states = None # [state] ordered by full index, built by self.init_space() when the state space is reduced
+        self.space_index = None # {full index: index in self.space_states}
+        self.mirrors = [] # [(tile map, food map, action map)] of the layout, found by self.init_space() when self.symmetric is set
+        self.canonical = None # {full index: (full index of the canonical state, 0 or 1 + index in self.mirrors mapping to it)}
+        super().__init__(*args, **kwargs)
+
     def init_agents(self, pacmanAgent = "key", evil = False):
         "Initialize agents with respect to the given type (@pacmanAgent)."
+        self.init_space()
         if pacmanAgent == "key":
-            self.pacman = Agents.KeyboardAgent(self.state['pacman_pos'])
+            self.pacman = Agents.KeyboardAgent(self.point(self.state['pacman_pos']))
             self.pacman.change_speed(2)
         elif pacmanAgent == "value":
-            self.pacman = Agents.ValueIterationAgent(self, 0.5, self.state['pacman_pos'])
+            self.pacman = Agents.ValueIterationAgent(self, 0.5, self.point(self.state['pacman_pos']))
+        elif pacmanAgent == "gsvalue":
+            self.pacman = Agents.GaussSeidelValueIterationAgent(self, 0.5, self.point(self.state['pacman_pos']))
+        elif pacmanAgent == "sparsevalue":
+            import SparseMDP # needs NumPy, so only loaded when asked for
+            self.pacman = SparseMDP.SparseValueIterationAgent(self, 0.5, self.point(self.state['pacman_pos']))
+        elif pacmanAgent == "parallelvalue":
+            import ParallelMDP
+            self.pacman = ParallelMDP.ParallelValueIterationAgent(self, 0.5, self.point(self.state['pacman_pos']))
+        elif pacmanAgent == "sweep":
+            self.pacman = Agents.PrioritizedSweepingAgent(self, 0.5, self.point(self.state['pacman_pos']))
         elif pacmanAgent == "policy":
-            self.pacman = Agents.PolicyIterationAgent(self, 0.5, self.state['pacman_pos'])
+            self.pacman = Agents.PolicyIterationAgent(self, 0.5, self.point(self.state['pacman_pos']))
+        elif pacmanAgent == "parallelpolicy":
+            import ParallelMDP
+            self.pacman = ParallelMDP.ParallelPolicyIterationAgent(self, 0.5, self.point(self.state['pacman_pos']))
+        elif pacmanAgent == "gspolicy":
+            self.pacman = Agents.GaussSeidelPolicyIterationAgent(self, 0.5, self.point(self.state['pacman_pos']))
+        elif pacmanAgent == "exactpolicy":
+            import SparseMDP # needs NumPy, so only loaded when asked for
+            self.pacman = SparseMDP.SparsePolicyIterationAgent(self, 0.5, self.point(self.state['pacman_pos']))
         else:
             print("invalid agent name, use default agent instead (keyboard)")
-            self.pacman = Agents.KeyboardAgent(self.state['pacman_pos'])
+            self.pacman = Agents.KeyboardAgent(self.point(self.state['pacman_pos']))
             self.pacman.change_speed(2)
         if evil:
-            self.ghosts = [Agents.AstarGhostAgent(0, self.state['ghost1_pos'])]
+            self.ghosts = [Agents.AstarGhostAgent(0, self.point(self.state['ghost1_pos']))]
             self.ghosts[0].change_speed(4)
         else:
-            self.ghosts = [Agents.VIRandomGhostAgent(0, self.state['ghost1_pos'])]
+            self.ghosts = [Agents.VIRandomGhostAgent(0, self.point(self.state['ghost1_pos']))]
+        self.ghosts[0].maze = self.maze
     
     def initialize(self):
         "Initialize game state."
@@ -40,17 +73,37 @@ class ValueIterGame(Game):
             0, 0, 0, 0, 0, 0, 0, 0, 0,
         ]
         self.foods = [vector(0, 0), vector(0, 40), vector(-40, 20), vector(40, 20)]
-        self.state = {'score': 0, 'pacman_pos': vector(0, -20),
-                            'ghost1_pos': vector(0, 60),
-                            'food_num': self.tiles.count(1),
-                            'foods': self.foods}
+        self.food_index = {self.offset(f): i for i, f in enumerate(self.foods)} # {tile index: i}, the food of bit i in state['food_bits']
+        self.posb_poses = [idx for idx in range(len(self.tiles)) if self.tiles[idx] > 0]
+        self.pos_index = {idx: k for k, idx in enumerate(self.posb_poses)}
+        self.state = {'score': 0, 'pacman_pos': self.position(vector(0, -20)),
+                            'ghost1_pos': self.position(vector(0, 60)),
+                            'food_bits': (1 << len(self.foods)) - 1} # bit i set if self.foods[i] is left
+
+    def init_space(self):
+        "Build the reduced state space once if self.reachable or self.symmetric is set."
+        "The mirrors are checked against the ghost's moves in self.maze, so this runs in self.init_agents, before any agent plans."
+        "If no mirror of the layout is kept, self.symmetric is reset, so the agents plan on and save the model of the unreduced space."
+        if not (self.reachable or self.symmetric) or self.space_states is not None:
+            return
+        if self.symmetric:
+            self.mirrors = self.find_mirrors()
+            if not self.mirrors:
+                print("no mirror of the layout maps the ghost's moves onto each other (see find_mirrors), planning without symmetry")
+                self.symmetric = False
+                if not self.reachable:
+                    return
+        states = self.reachablestates() if self.reachable else list(self.allstates())
+        if self.symmetric:
+            self.canonical = self.canonicalize([self.full_index(s) for s in states])
+            states = [s for s in states if self.canonical[self.full_index(s)][0] == self.full_index(s)]
+        self.space_states = states
+        self.space_index = {self.full_index(s): i for i, s in enumerate(states)}
 
     def offset(self, point):
         "Return offset of point in tiles."
-        x = (floor(point.x, 20) + 80) / 20
-        y = (80 - floor(point.y, 20)) / 20
-        index = int(x + y * 9)
-        return index
+        "Same as flooring @point to its tile with freegames.floor, in integer arithmetic."
+        return int((point.x + 200) // 20 - 6 + (14 - (point.y + 200) // 20) * 9)
 
     def cord(self, index):
         "Return coordinate of index in tiles"
@@ -61,44 +114,35 @@ class ValueIterGame(Game):
     def nextstate(self, agent, param1, param2):
         "Return the updated state for the given @agent and action(@param1, @param2)."
         if agent == "sim_pac": # move the pacman due to given action (@param1) from the given state (@param2)
-            state = deepcopy(param2)
-            aim = param1
-            state["pacman_pos"] = state["pacman_pos"] + aim
-            index = self.offset(state	["pacman_pos"])
-
-            tiles = self.tiles.copy()
-            for ef in (f for f in self.foods if f not in state["foods"]):
-                tiles[self.offset(ef)] = 2
-
-            if tiles[index] == 1:
-                state['score'] += 1
-                state['food_num'] -= 1
-                state['foods'].remove(vector(*self.cord(index)))
-
-            end = self.end_game(state)
-            if end == 2:
-                state['score'] += 100
-            if end == 1:
-                state['score'] -= 200
-            return state
+            return self.pacman_step(param2, self.delta(param1))
 
         if agent == "sim_ghost": # move the ghost due to given action (@param1) from the given Qstate (@param2)
-            state = deepcopy(param2)
-            aim = param1
-            state["ghost1_pos"] = state["ghost1_pos"] + aim
-            index = self.offset(state["ghost1_pos"])
-            
-            end = self.end_game(state)
-            if end == 1:
-                state['score'] -= 200
-            return state
+            return self.ghosts_step(param2, [self.delta(param1)])
 
         return super().nextstate(agent, param1, param2)
 
-    def food_eaten_update(self, index):
-        "Update game state due to a eaten food on @index."
-        super().food_eaten_update(index)
-        self.state['foods'].remove(vector(*self.cord(index)))
+    def copy_state(self, state):
+        "Return a copy of @state which self.pacman_apply and self.ghosts_apply can change without touching @state."
+        "Every value of a state is an int, so a shallow copy is enough."
+        return dict(state)
+
+    def eat(self, state, index):
+        "Eat the food on tile @index of @state in place, if it's still in state['food_bits']."
+        "@Return: whether there was food."
+        i = self.food_index.get(index)
+        if i is None or state['food_bits'] >> i & 1 == 0:
+            return False
+        state['food_bits'] &= ~(1 << i)
+        state['score'] += 1
+        return True
+
+    def uneat(self, state, index):
+        "Put the food eaten on tile @index back into @state. (the score is restored by self.undo)"
+        state['food_bits'] |= 1 << self.food_index[index]
+
+    def food_left(self, state):
+        "Return the number of food left in @state."
+        return bin(state['food_bits']).count("1")
 
     def end_game(self, state = None):
         """
@@ -106,37 +150,176 @@ class ValueIterGame(Game):
         @Return: 1 for losing, 2 for winning, 0 for not ended
         """
         state = self.state if state is None else state
-        if abs(state["pacman_pos"] - state["ghost1_pos"]) < 20:
+        if self.collide(state["pacman_pos"], state["ghost1_pos"]):
             return 1
-        if state["food_num"] == 0:
+        if state["food_bits"] == 0:
             return 2
         return 0
 
+    def fingerprint(self):
+        "Return a digest of the layout, the food positions and the state space, which define the states and their indices,"
+        "and of the ghost's chase moves, which the ghost model of the MDP agents is built from. (see MDPAgent.ghost_responses)"
+        layout = (self.tiles, [tuple(f) for f in self.foods], [[self.maze.first_move(g, p) for p in self.posb_poses] for g in self.posb_poses])
+        if self.space_index is not None:
+            layout += (sorted(self.space_index),)
+        return hashlib.sha256(repr(layout).encode()).digest()
+
+    def modelpath(self, filename):
+        "Return the model file to use instead of @filename for the current state space, so the models of different state spaces don't overwrite each other."
+        root, ext = os.path.splitext(filename)
+        if self.reachable:
+            root += "-reachable"
+        if self.symmetric:
+            root += "-symmetric"
+        return root + ext
+
+    def num_states(self):
+        "Return the number of states yielded by self.allstates()."
+        if self.space_states is not None:
+            return len(self.space_states)
+        return len(self.posb_poses) ** 2 << len(self.foods)
+
+    def state_index(self, state):
+        "Return the dense integer index of @state, which is its position in self.allstates()."
+        "A mirrored state gets the index of its canonical state."
+        full = self.full_index(state)
+        if self.symmetric:
+            full = self.canonical[full][0]
+        if self.space_index is not None:
+            return self.space_index[full]
+        return full
+
+    def mirror_action(self, state, action):
+        "Return @action, planned for the canonical state of @state, mirrored back to @state."
+        if not self.symmetric:
+            return action
+        mirror = self.canonical[self.full_index(state)][1]
+        if mirror == 0:
+            return action
+        return self.mirrors[mirror - 1][2][action] # every mirror is its own inverse
+
+    def find_mirrors(self):
+        "Return the left-right, up-down and point mirror symmetries of the layout and the foods as [(tile map, food map, action map)]."
+        """
+        A mirror is only kept if it also maps the ghost's chase moves (self.maze.first_move, which the ghost model of the MDP agents
+        is built from) onto each other. The ghost's A* search breaks ties by a fixed action order, which a mirror
+        may not respect, and then mirrored states don't have mirrored values.
+        """
+        xs = [self.cord(idx)[0] for idx in self.posb_poses]
+        ys = [self.cord(idx)[1] for idx in self.posb_poses]
+        foods = [tuple(f) for f in self.foods]
+        flips = [
+            (True, False, {"left": "right", "right": "left"}),
+            (False, True, {"up": "down", "down": "up"}),
+            (True, True, {"left": "right", "right": "left", "up": "down", "down": "up"})
+        ]
+        mirrors = []
+        for flip_x, flip_y, swap in flips:
+            def flip(x, y):
+                return (min(xs) + max(xs) - x if flip_x else x, min(ys) + max(ys) - y if flip_y else y)
+            tile_map = {idx: self.offset(vector(*flip(*self.cord(idx)))) for idx in self.posb_poses}
+            if any(m not in self.pos_index or self.tiles[m] != self.tiles[idx] for idx, m in tile_map.items()):
+                continue
+            if any(flip(*f) not in foods for f in foods):
+                continue
+            food_map = [foods.index(flip(*f)) for f in foods]
+            action_map = {n: swap.get(n, n) for n in Agents.ACTIONS}
+            if any(action_map[self.maze.first_move(g, p)] != self.maze.first_move(tile_map[g], tile_map[p]) for g in self.posb_poses for p in self.posb_poses):
+                continue
+            mirrors.append((tile_map, food_map, action_map))
+        return mirrors
+
+    def mirror_index(self, full, mirror):
+        "Return the full index of the state with full index @full mirrored by @mirror."
+        tile_map, food_map, _ = mirror
+        nfoods = len(self.foods)
+        fd = full & ((1 << nfoods) - 1)
+        pc, gh = divmod(full >> nfoods, len(self.posb_poses))
+        pc = self.pos_index[tile_map[self.posb_poses[pc]]]
+        gh = self.pos_index[tile_map[self.posb_poses[gh]]]
+        mfd = 0
+        for i in range(nfoods):
+            if (fd >> i) % 2 == 1:
+                mfd |= 1 << food_map[i]
+        return (pc * len(self.posb_poses) + gh) << nfoods | mfd
+
+    def canonicalize(self, fulls):
+        "Map every full index in @fulls to its canonical state, the mirrored state in @fulls with the smallest index."
+        "@Return: {full index: (full index of the canonical state, 0 or 1 + index in self.mirrors mapping to it)}"
+        present = set(fulls)
+        canonical = {}
+        for full in fulls:
+            best = (full, 0)
+            for k, mirror in enumerate(self.mirrors):
+                m = self.mirror_index(full, mirror)
+                if m in present and m < best[0]:
+                    best = (m, k + 1)
+            canonical[full] = best
+        return canonical
+
+    def full_index(self, state):
+        "Return the index of @state in the full (pacman tile x ghost tile x food subset) state space."
+        "The index packs (pacman tile, ghost tile, food bitmask) with the food bitmask (state['food_bits']) in the lowest bits."
+        pc = self.pos_index[state["pacman_pos"]]
+        gh = self.pos_index[state["ghost1_pos"]]
+        return (pc * len(self.posb_poses) + gh) << len(self.foods) | state["food_bits"]
+
+    def text_state(self, state):
+        "Return @state in the form of the states in the text models, with pixel vectors and a list of the food left."
+        foods = [self.foods[i] for i in range(len(self.foods)) if state["food_bits"] >> i & 1]
+        return {"score": state["score"], "pacman_pos": vector(*self.cord(state["pacman_pos"])), "ghost1_pos": vector(*self.cord(state["ghost1_pos"])), "foods": foods, "food_num": len(foods)}
+
+    def reachablestates(self):
+        "Return the states reachable from the current (initial) state with BFS over the one-tile moves in self.maze, ordered by self.full_index."
+        "Ended states are included but not expanded."
+        start = self.copy_state(self.state)
+        seen = {self.full_index(start): start}
+        q = deque([start])
+        while q:
+            s = q.popleft()
+            if self.end_game(s) != 0:
+                continue
+            nss = []
+            for _, pc in self.maze.neighbors[s["pacman_pos"]]:
+                Qstate = self.pacman_step(s, pc - s["pacman_pos"])
+                if self.end_game(Qstate) != 0:
+                    nss.append(Qstate)
+                    continue
+                for _, gh in self.maze.neighbors[Qstate["ghost1_pos"]]:
+                    nss.append(self.ghosts_step(Qstate, [gh - Qstate["ghost1_pos"]]))
+            for ns in nss:
+                idx = self.full_index(ns)
+                if idx not in seen:
+                    seen[idx] = ns
+                    q.append(ns)
+        return [seen[idx] for idx in sorted(seen)]
+
     def allstates(self):
         "Return all possible states in this game setting."
-        posb_poses = [idx for idx in range(len(self.tiles)) if self.tiles[idx] > 0]
-        for pc_idx in posb_poses:
-            for gh_idx in posb_poses:
-                for fd in range(16):
-                    foods = []
-                    for i in range(4):
-                        if (fd >> i) % 2 == 1:
-                            foods.append(self.foods[i])
-                    food_num = len(foods)
-                    score = 4 - food_num
+        "If self.reachable is set, only the states reachable from the initial state; if self.symmetric is set, only canonical states."
+        if self.space_states is not None:
+            yield from self.space_states
+            return
+        for pc_idx in self.posb_poses:
+            for gh_idx in self.posb_poses:
+                for fd in range(1 << len(self.foods)):
+                    food_num = bin(fd).count("1")
+                    score = len(self.foods) - food_num
                     if pc_idx == gh_idx:
                         score -= 200
                     elif food_num == 0:
                         score += 100
-                    yield {"score": score, "pacman_pos": vector(*self.cord(pc_idx)), "ghost1_pos": vector(*self.cord(gh_idx)), "foods": foods, "food_num": len(foods)}
+                    yield {"score": score, "pacman_pos": pc_idx, "ghost1_pos": gh_idx, "food_bits": fd}
 
 def main():
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument("-p", "--pacmanAgent", help = "specify which agent to be used as the pacman agent (key/value/policy)")
+    parser.add_argument("-p", "--pacmanAgent", help = "specify which agent to be used as the pacman agent (key/value/gsvalue/sparsevalue/parallelvalue/sweep/policy/parallelpolicy/gspolicy/exactpolicy)")
     parser.add_argument("-e", "--evil", help = "whether to fight the evil.", action = "store_true", default = False)
+    parser.add_argument("-r", "--reachable", help = "plan only on the states reachable from the initial state.", action = "store_true", default = False)
+    parser.add_argument("-s", "--symmetric", help = "plan only on one of every set of mirrored states.", action = "store_true", default = False)
     args = parser.parse_args()
-    g = ValueIterGame(False, args.pacmanAgent, args.evil)
+    g = ValueIterGame(False, args.pacmanAgent, args.evil, reachable = args.reachable, symmetric = args.symmetric)
     g.main()
 
 if __name__ == "__main__":
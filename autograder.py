@@ -11,12 +11,8 @@ def q1():
     try:
         for i in range(10):
             while g.end_game() == 0:
-                qs = g.nextstate("sim_pac", g.pacman.will_move(g.valid, g.state), g.state)
-                g.pacman.position = qs["pacman_pos"]
-                g.state = qs
-                ns = g.nextstate("sim_ghost", g.ghosts[0].will_move(g.valid, g.state), g.state)
-                g.ghosts[0].position = ns["ghost1_pos"]
-                g.state = ns
+                g.state, _, _ = g.step(g.state, g.pacman.will_move(g.valid, g.state))
+                g.reposition_agents()
             if g.end_game() == 2:
                 point += 1
             print("Game %d score: %d" % (i + 1, g.state["score"]))
@@ -35,12 +31,8 @@ def q2():
     try:
         for i in range(10):
             while g.end_game() == 0:
-                qs = g.nextstate("sim_pac", g.pacman.will_move(g.valid, g.state), g.state)
-                g.pacman.position = qs["pacman_pos"]
-                g.state = qs
-                ns = g.nextstate("sim_ghost", g.ghosts[0].will_move(g.valid, g.state), g.state)
-                g.ghosts[0].position = ns["ghost1_pos"]
-                g.state = ns
+                g.state, _, _ = g.step(g.state, g.pacman.will_move(g.valid, g.state))
+                g.reposition_agents()
             if g.end_game() == 2:
                 point += 1
             print("Game %d score: %d" % (i + 1, g.state["score"]))
@@ -59,10 +51,8 @@ def q3():
     try:
         for i in range(10):
             while g.end_game() == 0:
-                qs = g.nextstate("sim_pac", g.pacman.will_move(g.valid, g.state))
-                g.pacman.position = qs["pacman_pos"]
-                ns = g.nextstate("sim_ghost_best_Q")
-                g.ghosts[0].position = ns["ghost1_pos"]
+                g.state, _, _ = g.step(g.state, g.pacman.will_move(g.valid, g.state))
+                g.reposition_agents()
             if g.end_game() == 2:
                 point += 1
             print("Game %d score: %f" % (i + 1, g.state["score"]))
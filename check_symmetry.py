@@ -0,0 +1,78 @@
+"""
+Check that planning on the symmetry-reduced state space (ValueIterGame -s) gives the values and policy of the full state space.
+The layout of ValueIterGame keeps no mirror (see ValueIterGame.find_mirrors), so the check plans on CrossGame instead.
+Run with: python check_symmetry.py
+"""
+from ValueIterGame import ValueIterGame as VIG
+from freegames import vector as v
+import tempfile
+import traceback
+import os
+
+class CrossGame(VIG):
+    """
+    ValueIterGame on a cross-shaped layout with a food at the end of every arm. It's a tree, so the ghost's chase moves have no
+    ties to break and all three mirrors of the layout are kept, unlike the layout of ValueIterGame.
+    Its models are saved in self.modeldir, so they don't replace the ones of ValueIterGame.
+    """
+    def __init__(self, modeldir, *args, **kwargs):
+        self.modeldir = modeldir
+        super().__init__(*args, **kwargs)
+
+    def initialize(self):
+        super().initialize()
+        self.tiles = [0] * 81
+        for k in range(1, 8):
+            self.tiles[4 * 9 + k] = 2
+            self.tiles[k * 9 + 4] = 2
+        self.foods = [v(-60, 0), v(60, 0), v(0, 60), v(0, -60)]
+        for f in self.foods:
+            self.tiles[self.offset(f)] = 1
+        self.food_index = {self.offset(f): i for i, f in enumerate(self.foods)}
+        self.posb_poses = [idx for idx in range(len(self.tiles)) if self.tiles[idx] > 0]
+        self.pos_index = {idx: k for k, idx in enumerate(self.posb_poses)}
+        self.state = {'score': 0, 'pacman_pos': self.position(v(0, -20)),
+                            'ghost1_pos': self.position(v(0, 40)),
+                            'food_bits': (1 << len(self.foods)) - 1}
+
+    def modelpath(self, filename):
+        return os.path.join(self.modeldir, super().modelpath(filename))
+
+def check(agent, modeldir):
+    "Plan with @agent on the full and the symmetric state space of CrossGame, and return whether they agree."
+    """
+    The values of value iteration agree up to its convergence threshold. An action counts as the same as in the full plan if its
+    Q-value under the full plan is the largest one, since mirrored states may break ties between equally good actions differently.
+    """
+    full = CrossGame(modeldir, True, agent)
+    reduced = CrossGame(modeldir, True, agent, symmetric = True)
+    print("%s: %d mirrors, %d states instead of %d" % (agent, len(reduced.mirrors), reduced.num_states(), full.num_states()))
+    model = full.pacman.compiled_model()
+    same = len(reduced.mirrors) == 3
+    for s in full.allstates():
+        i = full.state_index(s)
+        if agent == "value" and abs(full.pacman.V[i] - reduced.pacman.V[reduced.state_index(s)]) > 1e-3:
+            same = False
+        if not isinstance(model[i], list):
+            continue
+        Q = {a: sum(prob * (R + full.pacman.gamma * full.pacman.V[j]) for prob, j, R in outcomes) for a, outcomes in model[i]}
+        if Q[reduced.pacman.best_of_state(s)] < max(Q.values()) - 1e-9:
+            same = False
+    return same
+
+def main():
+    failed = 0
+    with tempfile.TemporaryDirectory() as modeldir:
+        for agent in ["value", "policy"]:
+            try:
+                ok = check(agent, modeldir)
+            except:
+                traceback.print_exc()
+                ok = False
+            print("%s: %s" % (agent, "ok" if ok else "FAILED"))
+            failed += not ok
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()